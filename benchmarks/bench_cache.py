@@ -0,0 +1,51 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from emulate_code_insite import count_data_tx, data_tx_names, main as run_pipeline
+from column_cache import CACHE_FOLDER, cached_tables, read_table, read_table_columns, read_transmitter
+
+SAMPLE_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Sample Wireless InSite output files')
+
+# This function times a callable and returns the best time of several repeats
+def best_of(repeat, func):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark reopening the merged tables from the Excel sheets against the columnar cache')
+    parser.add_argument('folder', nargs='?', default=SAMPLE_FOLDER, help='folder with Wireless InSite .p2m files (processed in a temporary copy)')
+    parser.add_argument('--repeat', type=int, default=5, help='number of repeats (best time is reported)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Process a copy of the folder once, keeping both the Excel sheets and the cache
+        folder = os.path.join(tmp, 'InSiteOutput')
+        shutil.copytree(args.folder, folder)
+        run_pipeline(folder, export_excel=True)
+        merged_data_file_path = os.path.join(folder, 'merged_data')
+        cache_path = os.path.join(folder, CACHE_FOLDER)
+        # Only the tables that also have an Excel export (a folder processed with --statistics also caches ChannelStatsTX<k>_)
+        tables = data_tx_names(count_data_tx(set(cached_tables(cache_path)))) + ['Loss_', 'Power_']
+
+        timings = [
+            ('pd.read_excel, all tables', 1, lambda: [pd.read_excel(os.path.join(merged_data_file_path, name + '.xlsx'), header=None).values for name in tables]),
+            ('cache, all tables', args.repeat, lambda: [read_table(cache_path, name) for name in tables]),
+            ('cache, one transmitter', args.repeat, lambda: read_transmitter(cache_path, 1)),
+            ('cache, one column', args.repeat, lambda: read_table_columns(cache_path, 'DataTX1_', ['power'])['power'].sum()),
+        ]
+        print(f'{"read":<28} {"time (ms)":>10}')
+        for label, repeat, func in timings:
+            print(f'{label:<28} {best_of(repeat, func) * 1e3:>10.2f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from emulate_code_insite import GRID_SIZE, main as run_pipeline, ray_tracer_file_names
+from profiling import path_size
+from synthetic_insite import SAMPLE_TX_SETS, write_scaled_insite
+
+# Output options compared by the benchmark (label, layout, float32, compress)
+VARIANTS = [
+    ('dense', 'dense', False, False),
+    ('dense float32 compressed', 'dense', True, True),
+    ('sparse', 'sparse', False, False),
+    ('sparse compressed', 'sparse', False, True),
+    ('coo', 'coo', False, False),
+    ('coo float32 compressed', 'coo', True, True),
+]
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the time, peak memory and size of the MATLAB files written with the dense, sparse and coo layouts')
+    parser.add_argument('--scale', type=float, default=10, help='size of the synthetic folder relative to the sample folder (78 receiver points over 4 receiver sets)')
+    parser.add_argument('--tx', type=int, default=SAMPLE_TX_SETS, help='number of transmitter sets')
+    parser.add_argument('--grid-size', type=int, default=GRID_SIZE, help='size of the receiver grid')
+    parser.add_argument('--skip-dense', action='store_true', help='leave out the dense layout (for grids too large to hold in memory)')
+    args = parser.parse_args()
+
+    variants = [variant for variant in VARIANTS if not (args.skip_dense and variant[1] == 'dense')]
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = os.path.join(tmp, 'synthetic')
+        summary = write_scaled_insite(folder, args.scale, n_tx=args.tx, grid_size=args.grid_size)
+        print(f'{summary["receivers"]} receivers, {summary["paths"]} paths, {args.grid_size}x{args.grid_size} grid')
+        for position, (label, layout, float32, compress) in enumerate(variants):
+            # The merged tables are built by the first run only; the next runs only rewrite the MATLAB files, since their options changed
+            report = run_pipeline(folder, force=position == 0, profile=True, rx_positions_file=summary['rx_positions_file'], layout=layout, float32=float32, compress=compress, grid_size=args.grid_size)
+            stage = [stage for stage in report['stages'] if stage['name'] == 'write_ray_tracer_files'][0]
+            size = sum(path_size(os.path.join(folder, 'merged_data', name)) for name in ray_tracer_file_names(len(summary['tx_sets'])))
+            results.append((label, stage['wall_s'], stage['peak_rss_bytes'], size))
+
+    print(f'{"layout":<26} {"time (s)":>9} {"peak RSS (MB)":>14} {"size (MB)":>11}')
+    for label, wall, rss, size in results:
+        rss = '' if rss is None else f'{rss / 1e6:.1f}'
+        print(f'{label:<26} {wall:>9.3f} {rss:>14} {size / 1e6:>11.3f}')
+
+if __name__ == '__main__':
+    main()
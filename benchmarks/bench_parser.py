@@ -0,0 +1,65 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from emulate_code_insite import process_and_save_file
+from p2m_parser import FLAT_METRICS, NESTED_METRICS, p2m_metric, read_p2m
+
+SAMPLE_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Sample Wireless InSite output files')
+
+# This function mirrors the parsing half of process_and_save_file (readlines, split, pad with 'NaN', object DataFrame)
+def legacy_parse(file_path, lines_to_remove):
+    with open(file_path, 'r') as f:
+        lines = f.readlines()[lines_to_remove:]
+    processed_lines = []
+    for line in lines:
+        columns = line.strip().split()
+        if len(columns) < 2:
+            columns = columns + ['NaN'] * (2 - len(columns))
+        processed_lines.append(columns)
+    return pd.DataFrame(processed_lines)
+
+# This function times a callable over all files and returns the best total of several repeats
+def best_of(repeat, files, func):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for file_path in files:
+            func(file_path)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the .p2m parser against the current readlines/DataFrame path')
+    parser.add_argument('folder', nargs='?', default=SAMPLE_FOLDER, help='folder with Wireless InSite .p2m files')
+    parser.add_argument('--repeat', type=int, default=5, help='number of repeats (best time is reported)')
+    parser.add_argument('--excel', action='store_true', help='also time the full process_and_save_file path including to_excel')
+    args = parser.parse_args()
+
+    files = sorted(os.path.join(args.folder, f) for f in os.listdir(args.folder) if f.endswith('.p2m'))
+    groups = {
+        'flat': [f for f in files if p2m_metric(f) in FLAT_METRICS],
+        'nested': [f for f in files if p2m_metric(f) in NESTED_METRICS],
+    }
+
+    print(f'{"layout":<8} {"files":>6} {"MB":>8} {"legacy (s)":>11} {"parser (s)":>11} {"speedup":>8}')
+    for layout, group in groups.items():
+        if not group:
+            continue
+        lines_to_remove = 6 if layout == 'nested' else 3
+        size_mb = sum(os.path.getsize(f) for f in group) / 1e6
+        legacy = best_of(args.repeat, group, lambda f: legacy_parse(f, lines_to_remove))
+        native = best_of(args.repeat, group, read_p2m)
+        print(f'{layout:<8} {len(group):>6} {size_mb:>8.2f} {legacy:>11.4f} {native:>11.4f} {legacy / native:>7.1f}x')
+
+        if args.excel:
+            with tempfile.TemporaryDirectory() as tmp:
+                excel = best_of(1, group, lambda f: process_and_save_file(f, lines_to_remove, os.path.join(tmp, 'out.xlsx')))
+            print(f'{"":<8} {"":>6} {"":>8} {"with to_excel":>11}: {excel:.4f} s ({excel / native:.1f}x slower than parser)')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from emulate_code_insite import main as run_pipeline
+from synthetic_insite import SAMPLE_TX_SETS, write_scaled_insite
+
+# This function returns the kind of a profiled stage, i.e. its name without the table or transmitter it ran for (e.g. 'merge_p2m_data' for 'merge_p2m_data DataTX1_')
+def stage_kind(name):
+    return name.split(' ')[0]
+
+# This function generates a synthetic output folder at one scale, runs the whole pipeline on it and returns the timings
+def run_scale(scale, args, tmp):
+    folder = os.path.join(tmp, f'scale{scale:g}')
+    start = time.perf_counter()
+    summary = write_scaled_insite(folder, scale, n_tx=args.tx)
+    generate = time.perf_counter() - start
+
+    start = time.perf_counter()
+    report = run_pipeline(folder, in_memory=not args.excel_pipeline, workers=args.workers, force=True, statistics=args.statistics, profile=True, rx_positions_file=summary['rx_positions_file'])
+    wall = time.perf_counter() - start
+
+    # Time and bytes read of every kind of stage, summed over its tables and transmitters
+    stages = {}
+    for stage in report['stages']:
+        kind = stages.setdefault(stage_kind(stage['name']), {'wall_s': 0.0, 'bytes_read': 0, 'rows': 0})
+        kind['wall_s'] += stage['wall_s']
+        kind['bytes_read'] += stage['bytes_read']
+        kind['rows'] += stage['rows'] or 0
+    return {'scale': scale, 'receivers': summary['receivers'], 'paths': summary['paths'], 'files': summary['files'], 'bytes': summary['bytes'],
+            'generate_s': generate, 'wall_s': wall, 'stages': stages}
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the whole pipeline and each stage on synthetic Wireless InSite output folders at multiples of the sample size')
+    parser.add_argument('--scales', type=float, nargs='+', default=[1, 10, 100], help='sizes relative to the sample folder (78 receiver points over 4 receiver sets)')
+    parser.add_argument('--tx', type=int, default=SAMPLE_TX_SETS, help='number of transmitter sets')
+    parser.add_argument('--workers', type=int, default=1, help='number of worker processes of the pipeline')
+    parser.add_argument('--excel-pipeline', action='store_true', help='time the Excel pipeline instead of the in-memory mode')
+    parser.add_argument('--statistics', action='store_true', help='also compute the channel statistics')
+    parser.add_argument('--json', help='save the results to this JSON file')
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for scale in args.scales:
+            results.append(run_scale(scale, args, tmp))
+
+    print(f'{"scale":>6} {"receivers":>10} {"paths":>10} {"input (MB)":>11} {"generate (s)":>13} {"pipeline (s)":>13} {"receivers/s":>12} {"MB/s":>8}')
+    for result in results:
+        print(f'{result["scale"]:>6g} {result["receivers"]:>10} {result["paths"]:>10} {result["bytes"] / 1e6:>11.2f} {result["generate_s"]:>13.2f} {result["wall_s"]:>13.2f}'
+              f' {result["receivers"] / result["wall_s"]:>12.1f} {result["bytes"] / 1e6 / result["wall_s"]:>8.3f}')
+
+    # Per stage: time at every scale, and receivers/s and MB/s (of the files the stage read) at the largest scale
+    largest = results[-1]
+    print()
+    labels = [f'{result["scale"]:g}x (s)' for result in results]
+    print(f'{"stage":<28}' + ''.join(f' {label:>11}' for label in labels) + f' {"receivers/s":>12} {"MB/s":>8}')
+    for kind in largest['stages']:
+        times = ''.join(f' {result["stages"].get(kind, {}).get("wall_s", float("nan")):>11.3f}' for result in results)
+        stage = largest['stages'][kind]
+        wall = max(stage['wall_s'], 1e-9)
+        print(f'{kind:<28}{times} {largest["receivers"] / wall:>12.0f} {stage["bytes_read"] / 1e6 / wall:>8.1f}')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from p2m_parser import P2MPaths
+from channel_stats import channel_statistics
+
+# This function times a callable and returns the best time of several repeats
+def best_of(repeat, func):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+# This function creates random cir, doppler, doa and dod paths for n_receivers receivers with up to max_paths paths each (some receivers have none)
+def synthetic_paths(n_receivers, max_paths, seed=0):
+    rng = np.random.default_rng(seed)
+    n_paths = rng.integers(0, max_paths + 1, n_receivers)
+    offsets = np.concatenate(([0], np.cumsum(n_paths)))
+    receiver = np.arange(1, n_receivers + 1)
+    path = np.arange(offsets[-1]) - np.repeat(offsets[:-1], n_paths) + 1
+    power = rng.uniform(-140, -60, offsets[-1])
+    columns = {
+        'cir': (rng.uniform(-180, 180, offsets[-1]), rng.uniform(1e-8, 1e-6, offsets[-1]), power),
+        'doppler': (rng.normal(0, 50, offsets[-1]), power),
+        'doa': (rng.uniform(-180, 180, offsets[-1]), rng.uniform(0, 180, offsets[-1]), power),
+        'dod': (rng.uniform(-180, 180, offsets[-1]), rng.uniform(0, 180, offsets[-1]), power),
+    }
+    return {metric: P2MPaths(receiver, offsets, path, np.column_stack(values)) for metric, values in columns.items()}
+
+# This function computes the same statistics with a Python loop over the receivers (the reference the segment reductions replace)
+def loop_statistics(paths):
+    offsets = paths['cir'].offsets
+    stats = []
+    for i in range(len(offsets) - 1):
+        rows = slice(offsets[i], offsets[i + 1])
+        power = 10 ** (paths['cir'].values[rows, 2] / 10)
+        if not len(power):
+            stats.append(None)
+            continue
+        total = power.sum()
+        phase = np.deg2rad(paths['cir'].values[rows, 0])
+        delay = paths['cir'].values[rows, 1]
+        mean_delay = (power * delay).sum() / total
+        record = [
+            10 * np.log10(total),
+            10 * np.log10(abs((np.sqrt(power) * np.exp(1j * phase)).sum())**2),
+            np.sqrt(max((power * delay**2).sum() / total - mean_delay**2, 0)),
+            np.sqrt(max((power * paths['doppler'].values[rows, 0]**2).sum() / total - ((power * paths['doppler'].values[rows, 0]).sum() / total)**2, 0)),
+        ]
+        for metric in ('doa', 'dod'):
+            for column in (0, 1):
+                angles = np.deg2rad(paths[metric].values[rows, column])
+                record.append(np.rad2deg(np.sqrt(-2 * np.log(min(abs((power * np.exp(1j * angles)).sum()) / total, 1)))))
+        with np.errstate(divide='ignore'):
+            record.append(10 * np.log10(power.max()) - 10 * np.log10(total - power.max()))
+        stats.append(record)
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the channel statistics (segment reductions over all receivers) against a loop over the receivers')
+    parser.add_argument('--receivers', type=int, default=200000, help='number of synthetic receivers')
+    parser.add_argument('--max-paths', type=int, default=25, help='largest number of paths of a receiver (Wireless InSite writes up to 25 by default)')
+    parser.add_argument('--loop-receivers', type=int, default=10000, help='number of receivers timed with the loop (the time is scaled to all receivers)')
+    parser.add_argument('--repeat', type=int, default=3, help='number of repeats (best time is reported)')
+    args = parser.parse_args()
+
+    paths = synthetic_paths(args.receivers, args.max_paths)
+    n_paths = int(paths['cir'].offsets[-1])
+    print(f'{args.receivers} receivers, {n_paths} paths')
+
+    vectorized = best_of(args.repeat, lambda: channel_statistics(**paths))
+
+    # Time the loop on the first receivers only and check that both give the same statistics there
+    n_loop = min(args.loop_receivers, args.receivers)
+    subset = {metric: P2MPaths(p.receiver[:n_loop], p.offsets[:n_loop + 1], p.path[:p.offsets[n_loop]], p.values[:p.offsets[n_loop]]) for metric, p in paths.items()}
+    start = time.perf_counter()
+    reference = loop_statistics(subset)
+    loop = (time.perf_counter() - start) * args.receivers / n_loop
+    stats = channel_statistics(**subset)
+    fields = ['IncoherentPower_dBm', 'CoherentPower_dBm', 'DelaySpread_s', 'DopplerSpread_Hz', 'AzimuthSpreadArrival_deg', 'ElevationSpreadArrival_deg',
+              'AzimuthSpreadDeparture_deg', 'ElevationSpreadDeparture_deg', 'KFactor_dB']
+    has_paths = np.array([record is not None for record in reference])
+    expected = np.array([record for record in reference if record is not None])
+    actual = np.column_stack([stats[field][has_paths] for field in fields])
+    # Spreads of single-path receivers cancel to rounding noise (one-pass moments), so the tolerance is relative to the scale of each statistic
+    scale = np.nanmax(np.where(np.isfinite(expected), np.abs(expected), np.nan), axis=0)
+    if not all(np.allclose(actual[:, i], expected[:, i], rtol=1e-9, atol=1e-7 * scale[i], equal_nan=True) for i in range(len(fields))):
+        raise AssertionError('The segment reductions and the loop over the receivers give different statistics')
+
+    print(f'{"method":<28} {"time (s)":>10} {"receivers/s":>14}')
+    print(f'{"segment reductions":<28} {vectorized:>10.3f} {args.receivers / vectorized:>14.0f}')
+    print(f'{"loop over receivers (est.)":<28} {loop:>10.3f} {args.receivers / loop:>14.0f}')
+    print(f'speed-up: {loop / vectorized:.0f}x')
+
+if __name__ == '__main__':
+    main()
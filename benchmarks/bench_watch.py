@@ -0,0 +1,76 @@
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from emulate_code_insite import main as run_pipeline
+from file_index import parse_file_name
+from synthetic_insite import SAMPLE_TX_SETS, write_scaled_insite
+from watch_insite import watch_folder
+
+# This function replays a finished output folder into an empty one like a running simulation: the files of one receiver set after the other, each written in two halves
+# Returns the time the last file was completely written
+async def replay_simulation(source, target, rx_sets, set_time):
+    files = sorted(os.listdir(source))
+    for rx in rx_sets:
+        rx_files = [file for file in files if parse_file_name(file) is not None and parse_file_name(file).rx == rx]
+        halves = {}
+        for file in rx_files:
+            with open(os.path.join(source, file), 'rb') as f:
+                data = f.read()
+            halves[file] = data[len(data) // 2:]
+            with open(os.path.join(target, file), 'wb') as f:
+                f.write(data[:len(data) // 2])
+        await asyncio.sleep(set_time)
+        for file in rx_files:
+            with open(os.path.join(target, file), 'ab') as f:
+                f.write(halves[file])
+    return time.monotonic()
+
+# This function runs the watch mode on the replayed simulation and returns the time from the end of the simulation to the MATLAB files
+async def watch_replay(source, target, summary, args, options):
+    watch = asyncio.create_task(watch_folder(target, summary['tx_sets'], summary['rx_sets'], workers=args.workers, poll_interval=args.poll_interval, settle_time=args.settle_time, **options))
+    simulation_end = await replay_simulation(source, target, summary['rx_sets'], args.set_time)
+    await watch
+    return time.monotonic() - simulation_end
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the time from the end of a (replayed) simulation to the MATLAB files with the watch mode and with a run of main() after the simulation')
+    parser.add_argument('--scale', type=float, default=10, help='size of the synthetic folder relative to the sample folder (78 receiver points over 4 receiver sets)')
+    parser.add_argument('--tx', type=int, default=SAMPLE_TX_SETS, help='number of transmitter sets')
+    parser.add_argument('--set-time', type=float, default=5, help='seconds the replayed simulation takes for each receiver set')
+    parser.add_argument('--workers', type=int, default=2, help='number of worker processes')
+    parser.add_argument('--poll-interval', type=float, default=0.2, help='seconds between two scans of the folder')
+    parser.add_argument('--settle-time', type=float, default=0.5, help='seconds a file must stay unchanged before it is parsed')
+    parser.add_argument('--layout', default='coo', help='layout of the MATLAB files (the dense layout makes writing the files dominate both times)')
+    parser.add_argument('--statistics', action='store_true', help='also compute the channel statistics')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'source')
+        summary = write_scaled_insite(source, args.scale, n_tx=args.tx)
+        options = {'rx_positions_file': summary['rx_positions_file'], 'statistics': args.statistics, 'layout': args.layout}
+        print(f'{summary["receivers"]} receivers, {summary["paths"]} paths, {summary["files"]} files')
+
+        # main() after the simulation has finished
+        batch = os.path.join(tmp, 'batch')
+        shutil.copytree(source, batch)
+        start = time.perf_counter()
+        run_pipeline(batch, workers=args.workers, **options)
+        after_end = time.perf_counter() - start
+
+        # Watch mode during the simulation
+        watched = os.path.join(tmp, 'watched')
+        os.makedirs(watched)
+        latency = asyncio.run(watch_replay(source, watched, summary, args, options))
+
+    print(f'{"mode":<28} {"simulation end to MATLAB files (s)":>36}')
+    print(f'{"main() after the simulation":<28} {after_end:>36.2f}')
+    print(f'{"watch mode":<28} {latency:>36.2f}')
+
+if __name__ == '__main__':
+    main()
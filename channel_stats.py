@@ -0,0 +1,108 @@
+import numpy as np
+
+# Per-receiver channel statistics, added as extra fields to Receiver_Ray_insite
+# Powers are the incoherent (sum of path powers) and coherent (power of the sum of the complex path amplitudes) total power, spreads are power-weighted RMS values,
+# angular spreads use the circular definition of 3GPP TR 38.901 and the K-factor is the strongest path against the sum of all other paths
+CHANNEL_STATS_DTYPE = np.dtype([
+    ('IncoherentPower_dBm', 'f8'),
+    ('CoherentPower_dBm', 'f8'),
+    ('MeanDelay_s', 'f8'),
+    ('DelaySpread_s', 'f8'),
+    ('AzimuthSpreadArrival_deg', 'f8'),
+    ('ElevationSpreadArrival_deg', 'f8'),
+    ('AzimuthSpreadDeparture_deg', 'f8'),
+    ('ElevationSpreadDeparture_deg', 'f8'),
+    ('KFactor_dB', 'f8'),
+    ('DopplerSpread_Hz', 'f8'),
+])
+
+# This function sums every receiver segment offsets[i]:offsets[i+1] along the last axis of an array (one row per quantity) in one reduction (0 for receivers without paths)
+def segment_sum(values, offsets):
+    starts = offsets[:-1]
+    padded = np.concatenate((values, np.zeros(values.shape[:-1] + (1,), dtype=values.dtype)), axis=-1)
+    sums = np.add.reduceat(padded, np.minimum(starts, values.shape[-1]), axis=-1)
+    sums[..., offsets[1:] == starts] = 0
+    return sums
+
+# This function returns the largest value of every receiver segment (-inf for receivers without paths)
+def segment_max(values, offsets):
+    starts = offsets[:-1]
+    maxima = np.maximum.reduceat(np.append(values, -np.inf), np.minimum(starts, len(values)))
+    maxima[offsets[1:] == starts] = -np.inf
+    return maxima
+
+# This function converts powers in mW to dBm (-inf for no power)
+def to_dbm(power):
+    with np.errstate(divide='ignore'):
+        return 10 * np.log10(power)
+
+# This function returns the power-weighted RMS spread from the segment sums of power * x and power * x**2
+def rms_spread(first, second, total_power):
+    mean = first / total_power
+    return mean, np.sqrt(np.maximum(second / total_power - mean**2, 0))
+
+# This function returns the circular angular spread (deg) from the segment sums of power * cos(angle) and power * sin(angle): sqrt(-2 ln(|sum(p exp(j angle))| / sum(p)))
+def angular_spread(cos_sum, sin_sum, total_power):
+    return np.rad2deg(np.sqrt(-2 * np.log(np.minimum(np.hypot(cos_sum, sin_sum) / total_power, 1))))
+
+# This function computes the channel statistics of all receivers of a receiver set from its parsed nested files (P2MPaths, see read_p2m_paths)
+# cir gives phase, delay and power, toa (used for the delays if there is no cir) delay and power, doppler the Doppler shift, doa/dod the arrival/departure angles
+# Statistics whose file is not given are NaN; all given files must have the same receivers and path counts
+def channel_statistics(cir=None, toa=None, doppler=None, doa=None, dod=None):
+    given = [paths for paths in (cir, toa, doppler, doa, dod) if paths is not None]
+    if not given:
+        raise ValueError('channel_statistics needs at least one of cir, toa, doppler, doa or dod')
+    offsets = given[0].offsets
+    if any(not np.array_equal(paths.offsets, offsets) for paths in given[1:]):
+        raise ValueError('The path files of a receiver set do not have the same receivers and path counts')
+
+    # Path powers (mW) from the last column, which every nested file holds
+    power = 10 ** (given[0].values[:, -1] / 10)
+
+    # Power-weighted per-path quantities, one row each, so that all receivers and quantities are summed in a single segment reduction
+    quantities = {'power': power}
+    if cir is not None:
+        phase = np.deg2rad(cir.values[:, 0])
+        amplitude = np.sqrt(power)
+        quantities['field_re'] = amplitude * np.cos(phase)
+        quantities['field_im'] = amplitude * np.sin(phase)
+    delays = cir.values[:, 1] if cir is not None else toa.values[:, 0] if toa is not None else None
+    if delays is not None:
+        quantities['delay'] = power * delays
+        quantities['delay2'] = quantities['delay'] * delays
+    if doppler is not None:
+        quantities['doppler'] = power * doppler.values[:, 0]
+        quantities['doppler2'] = quantities['doppler'] * doppler.values[:, 0]
+    for name, paths in (('arrival', doa), ('departure', dod)):
+        if paths is not None:
+            for column, angle in enumerate(('azimuth', 'elevation')):
+                radians = np.deg2rad(paths.values[:, column])
+                quantities[f'{angle}_{name}_cos'] = power * np.cos(radians)
+                quantities[f'{angle}_{name}_sin'] = power * np.sin(radians)
+    sums = dict(zip(quantities, segment_sum(np.vstack(list(quantities.values())), offsets)))
+
+    stats = np.full(len(offsets) - 1, np.nan, dtype=CHANNEL_STATS_DTYPE)
+    total_power = sums['power']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        stats['IncoherentPower_dBm'] = to_dbm(total_power)
+
+        # K-factor of the strongest path against the others
+        strongest = segment_max(power, offsets)
+        stats['KFactor_dB'] = to_dbm(strongest) - to_dbm(total_power - strongest)
+
+        if cir is not None:
+            stats['CoherentPower_dBm'] = to_dbm(sums['field_re']**2 + sums['field_im']**2)
+        if delays is not None:
+            stats['MeanDelay_s'], stats['DelaySpread_s'] = rms_spread(sums['delay'], sums['delay2'], total_power)
+        if doppler is not None:
+            stats['DopplerSpread_Hz'] = rms_spread(sums['doppler'], sums['doppler2'], total_power)[1]
+        if doa is not None:
+            stats['AzimuthSpreadArrival_deg'] = angular_spread(sums['azimuth_arrival_cos'], sums['azimuth_arrival_sin'], total_power)
+            stats['ElevationSpreadArrival_deg'] = angular_spread(sums['elevation_arrival_cos'], sums['elevation_arrival_sin'], total_power)
+        if dod is not None:
+            stats['AzimuthSpreadDeparture_deg'] = angular_spread(sums['azimuth_departure_cos'], sums['azimuth_departure_sin'], total_power)
+            stats['ElevationSpreadDeparture_deg'] = angular_spread(sums['elevation_departure_cos'], sums['elevation_departure_sin'], total_power)
+
+    # Receivers without paths have no statistics
+    stats[offsets[1:] == offsets[:-1]] = np.nan
+    return stats
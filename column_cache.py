@@ -0,0 +1,126 @@
+import json
+import os
+import numpy as np
+from p2m_parser import P2MPaths
+
+# Name of the cache folder, next to merged_data in the Wireless InSite output folder
+CACHE_FOLDER = 'merged_cache'
+
+# Name of the file listing the columns of a cached table (written last, so a table without it is incomplete)
+COLUMNS_FILE = 'columns.json'
+
+# Column names of the cached merged tables, in the order of the merged Excel sheets: the DataTX tables (one per transmitter), and the receiver point columns
+# followed by the columns of every transmitter in Loss_ and Power_ (columns ending in _tx<k> belong to transmitter k)
+DATA_TX_COLUMNS = ['path', 'rx_phi', 'rx_theta', 'power', 'tx_phi', 'tx_theta']
+RX_POINT_COLUMNS = ['point', 'x', 'y', 'z', 'dist']
+
+# This function returns the column names of a merged table with n_columns columns
+def table_columns(name, n_columns):
+    if name.startswith('DataTX'):
+        return DATA_TX_COLUMNS
+    if name == 'Loss_':
+        n_tx = (n_columns - len(RX_POINT_COLUMNS)) // 3
+        return RX_POINT_COLUMNS + [f'{metric}_tx{tx}' for metric in ('fspl', 'pl', 'xpl') for tx in range(1, n_tx + 1)]
+    if name == 'Power_':
+        n_tx = (n_columns - len(RX_POINT_COLUMNS)) // 2
+        return RX_POINT_COLUMNS + [f'{column}_tx{tx}' for tx in range(1, n_tx + 1) for column in ('power', 'phase')]
+    raise KeyError(f'Unknown merged table {name!r}')
+
+# This function returns the names of the tables in a cache folder
+def cached_tables(cache_path):
+    return sorted(name for name in os.listdir(cache_path) if os.path.exists(os.path.join(cache_path, name, COLUMNS_FILE)))
+
+# This function writes named arrays into a cache folder, one .npy file per array, and returns the path of the column list
+def write_columns(folder, columns):
+    os.makedirs(folder, exist_ok=True)
+    columns_file = os.path.join(folder, COLUMNS_FILE)
+    if os.path.exists(columns_file):
+        os.remove(columns_file)
+    for name, values in columns.items():
+        np.save(os.path.join(folder, name + '.npy'), values)
+    with open(columns_file, 'w') as f:
+        json.dump(list(columns), f)
+    return columns_file
+
+# This function returns the names of the arrays in a cache folder
+def column_names(folder):
+    with open(os.path.join(folder, COLUMNS_FILE), 'r') as f:
+        return json.load(f)
+
+# This function reads named arrays from a cache folder; with mmap the arrays are memory-mapped read-only, so only the pages that are used are read
+def read_columns(folder, names=None, mmap=True):
+    available = column_names(folder)
+    if names is None:
+        names = available
+    missing = [name for name in names if name not in available]
+    if missing:
+        raise KeyError(f'{folder}: no cached column {", ".join(missing)}')
+    return {name: np.load(os.path.join(folder, name + '.npy'), mmap_mode='r' if mmap else None) for name in names}
+
+# This function caches a merged table (2D array laid out like the merged Excel sheet) as one column per file and returns the path of the column list
+def write_table(cache_path, name, table):
+    columns = table_columns(name, table.shape[1])
+    if table.shape[1] != len(columns):
+        raise ValueError(f'{name}: expected {len(columns)} columns but got {table.shape[1]}')
+    return write_columns(os.path.join(cache_path, name), {column: np.ascontiguousarray(table[:, i]) for i, column in enumerate(columns)})
+
+# This function reads columns of a cached merged table as memory-mapped arrays; with tx, only the shared columns and the columns of that transmitter are read
+def read_table_columns(cache_path, name, columns=None, tx=None):
+    if columns is None:
+        columns = column_names(os.path.join(cache_path, name))
+    if tx is not None:
+        columns = [column for column in columns if '_tx' not in column or column.endswith(f'_tx{tx}')]
+    return read_columns(os.path.join(cache_path, name), columns)
+
+# This function reads a cached merged table back into a 2D array laid out like the merged Excel sheet
+def read_table(cache_path, name):
+    return np.column_stack(list(read_table_columns(cache_path, name).values()))
+
+# This function reads the DataTX, Power and Loss columns of one transmitter (1, 2, ...) as memory-mapped arrays
+def read_transmitter(cache_path, tx):
+    return {
+        'data': read_table_columns(cache_path, f'DataTX{tx}_'),
+        'power': read_table_columns(cache_path, 'Power_', tx=tx),
+        'loss': read_table_columns(cache_path, 'Loss_', tx=tx),
+    }
+
+# This function caches a structured array (one record per receiver, e.g. channel statistics) as one column per field and returns the path of the column list
+def write_records(cache_path, name, records):
+    return write_columns(os.path.join(cache_path, name), {field: np.ascontiguousarray(records[field]) for field in records.dtype.names})
+
+# This function reads a cached structured array back, with the fields in the order they were written
+def read_records(cache_path, name):
+    columns = read_columns(os.path.join(cache_path, name), mmap=False)
+    records = np.empty(len(next(iter(columns.values()))) if columns else 0, dtype=[(field, values.dtype) for field, values in columns.items()])
+    for field, values in columns.items():
+        records[field] = values
+    return records
+
+# This function returns the (size, mtime_ns) of a source file, stored with the arrays cached from it
+def source_signature(file_path):
+    stat = os.stat(file_path)
+    return stat.st_size, stat.st_mtime_ns
+
+# This function caches the parsed receiver -> path arrays of a nested .p2m file (doa, dod, cir, ...); values are stored column-major, so every value column is a contiguous slice of the memory map
+# source is the signature of the .p2m file the arrays were parsed from (see source_signature)
+def write_p2m_paths(cache_path, file, paths, source=None):
+    columns = {
+        'receiver': paths.receiver,
+        'offsets': paths.offsets,
+        'path': paths.path,
+        'values': np.asfortranarray(paths.values),
+    }
+    if source is not None:
+        columns['source'] = np.array(source, dtype=np.int64)
+    return write_columns(os.path.join(cache_path, 'p2m', file), columns)
+
+# This function reads the cached receiver -> path arrays of a nested .p2m file as memory-mapped arrays
+# With source, None is returned unless the arrays were cached from the .p2m file with that signature
+def read_p2m_paths_cache(cache_path, file, source=None):
+    folder = os.path.join(cache_path, 'p2m', file)
+    if source is not None:
+        if not os.path.exists(os.path.join(folder, COLUMNS_FILE)) or 'source' not in column_names(folder):
+            return None
+        if tuple(read_columns(folder, ['source'], mmap=False)['source']) != tuple(source):
+            return None
+    return P2MPaths(**read_columns(folder, P2MPaths._fields))
@@ -1,8 +1,21 @@
 import os
-import zipfile
+import argparse
+import asyncio
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from functools import partial
 import pandas as pd
 import numpy as np
 from scipy.io import savemat
+from scipy.sparse import csc_matrix
+from p2m_parser import INTERACTION_TYPES, count_p2m_rows, iter_paths_chunks, read_p2m_paths, read_p2m_table
+from file_index import build_file_index, build_sequence, check_file_index, discover_sets, lookup_files, order_sets, parse_file_name
+from mat_writer import write_mat_columns
+from column_cache import CACHE_FOLDER, COLUMNS_FILE, DATA_TX_COLUMNS, read_p2m_paths_cache, read_records, read_table, read_table_columns, source_signature, write_p2m_paths, write_records, write_table
+from channel_stats import CHANNEL_STATS_DTYPE, channel_statistics
+from profiling import PROFILE_FILE, count_files, new_profile, print_profile, profile_stage, save_profile
+from manifest import is_up_to_date, load_manifest, new_manifest, record_output, save_manifest
 
 # This function reads a file, removes specified lines, processes the remaining lines, and saves the data to an Excel file
 def process_and_save_file(file_path, lines_to_remove, output_path):
@@ -26,59 +39,73 @@ def process_and_save_file(file_path, lines_to_remove, output_path):
     data = pd.DataFrame(processed_lines)
     data.to_excel(output_path, index=False, header=False)
 
-# This function deletes unwanted files from a folder based on specified substrings
-def delete_unwanted_files(folder_path, substrings):
+# This function applies func to the items of the iterables, in a process pool when an executor is given (the results keep the order of the items either way)
+def map_files(func, *iterables, executor=None):
+    if executor is None:
+        return list(map(func, *iterables))
+    return list(executor.map(func, *iterables))
+
+# This function deletes unwanted files from a folder based on specified substrings (and converts the wanted ones to Excel files unless convert_to_excel is False)
+# If convert_filter is given, only the files for which it returns True are converted; the paths of the converted files are returned
+# With delete False, nothing is deleted (e.g. while Wireless InSite may still be writing into the folder)
+def delete_unwanted_files(folder_path, substrings, convert_to_excel=True, executor=None, convert_filter=None, delete=True):
     # Get the list of files in the specified folder
     files = os.listdir(folder_path)
 
+    # Collect the files to convert, then convert them (in parallel when an executor is given)
+    file_paths = []
+    lines_to_remove = []
+    for file in files:
+        # Only the .p2m files are converted, so the Excel files of an earlier run are left alone
+        if not file.endswith('.p2m'):
+            continue
+        if convert_to_excel and ('.dod.' in file or '.doa.' in file):
+            file_paths.append(os.path.join(folder_path, file))
+            lines_to_remove.append(6)
+        elif convert_to_excel and any(substring in file for substring in ['.fspl.', '.pl.', '.xpl.', '.power.']):
+            file_paths.append(os.path.join(folder_path, file))
+            lines_to_remove.append(3)
+    if convert_filter is not None:
+        selected = [convert_filter(file_path) for file_path in file_paths]
+        file_paths = [file_path for file_path, keep in zip(file_paths, selected) if keep]
+        lines_to_remove = [lines for lines, keep in zip(lines_to_remove, selected) if keep]
+    map_files(process_and_save_file, file_paths, lines_to_remove, [os.path.splitext(file_path)[0] + '.xlsx' for file_path in file_paths], executor=executor)
+
+    if not delete:
+        return file_paths
     for file in files:
         file_path = os.path.join(folder_path, file)
 
-        if '.dod.' in file or '.doa.' in file:
-            lines_to_remove = 6 if '.dod.' in file or '.doa.' in file else 3
-            process_and_save_file(file_path, lines_to_remove, os.path.splitext(file_path)[0] + '.xlsx')
-        elif any(substring in file for substring in ['.fspl.', '.pl.', '.xpl.', '.power.']):
-            process_and_save_file(file_path, 3, os.path.splitext(file_path)[0] + '.xlsx')
-
-        # Delete the file and print the name of the deleted file
-        if not any(substring in file for substring in substrings):
+        # Delete the file and print the name of the deleted file (sub-folders such as merged_data are kept)
+        if os.path.isfile(file_path) and not any(substring in file for substring in substrings):
             os.remove(file_path)
             print(f'Deleted file: {file}')
 
-# This function checks if a file is a valid ZIP file (otherwise opening and reading of Excel file wouldn't work)
-def is_zipfile(filepath):
-    try:
-        with zipfile.ZipFile(filepath, 'r') as _:
-            return True
-    except zipfile.BadZipFile:
-        return False
-
-# This function merges multiple Excel files based on specified substrings and saves the merged data to a new Excel file
-def merge_excel_files(folder_path, substrings, sequence_doa, sequence_dod, output_folder, output_file):
-    # Get the list of files in the specified folder and initialize empty lists to store data frames
-    files = os.listdir(folder_path)
+    return file_paths
+
+# This function reads the Excel files of a sequence (in parallel when an executor is given) and returns (file name, data frame) pairs in the order of the sequence
+def read_excel_sequence(folder_path, file_index, sequence, executor=None, **kwargs):
+    files = lookup_files(file_index, sequence, 'xlsx')
+    data_frames = map_files(partial(pd.read_excel, engine='openpyxl', header=None, **kwargs), [os.path.join(folder_path, file) for file in files], executor=executor)
+    return list(zip(files, data_frames))
+
+# This function merges multiple Excel files based on specified substrings, saves the merged data to a new Excel file and returns it
+def merge_excel_files(folder_path, substrings, sequence_doa, sequence_dod, output_folder, output_file, file_index=None, executor=None):
+    # Look up the Excel files of the sequences in the file index and initialize empty lists to store data frames
+    if file_index is None:
+        file_index = build_file_index(folder_path)
     data_frames_doa = []
     data_frames_dod = []
 
-    for substring in sequence_doa:
-        for file in files:
-            if substring in file:
-                file_path = os.path.join(folder_path, file)
-                if is_zipfile(file_path):
-                    df = pd.read_excel(file_path, engine='openpyxl', header=None)
-                    df = df.iloc[:, :4]  # Keep only the first four columns
-                    data_frames_doa.append(df)
-
-    for substring in sequence_dod:
-        for file in files:
-            if substring in file:
-                file_path = os.path.join(folder_path, file)
-                if is_zipfile(file_path):
-                    df = pd.read_excel(file_path, engine='openpyxl', header=None, skiprows=1, usecols="B,C")
-                    if '.dod.t001_02.' in file or '.dod.t001_01.' in file:
-                        nan_row = pd.DataFrame(np.nan, index=[0], columns=range(df.shape[1]))
-                        df = pd.concat([nan_row, df], ignore_index=True)
-                    data_frames_dod.append(df)
+    for file, df in read_excel_sequence(folder_path, file_index, sequence_doa, executor):
+        df = df.iloc[:, :4]  # Keep only the first four columns
+        data_frames_doa.append(df)
+
+    for file, df in read_excel_sequence(folder_path, file_index, sequence_dod, executor, skiprows=1, usecols="B,C"):
+        if '.dod.' in file:
+            nan_row = pd.DataFrame(np.nan, index=[0], columns=range(df.shape[1]))
+            df = pd.concat([nan_row, df], ignore_index=True)
+        data_frames_dod.append(df)
 
     # Concatenate the data frames for each sequence and then altogether
     merged_data_doa = pd.concat(data_frames_doa, ignore_index=True)
@@ -94,6 +121,7 @@ def merge_excel_files(folder_path, substrings, sequence_doa, sequence_dod, outpu
 
     output_file_path = os.path.join(output_folder_path, output_file)
     merged_data.to_excel(output_file_path, index=False, header=False)
+    return merged_data
 
 # This function adjusts the data by modifying specific columns.
 def adjust_data(data):
@@ -111,112 +139,43 @@ def adjust_data(data):
 
     return data
 
-# This function creates a Loss_ sheet by merging specific columns from Excel files based on provided sequences and saves it to a new Excel file
-def create_loss_sheet(folder_path, substrings, sequence_fspl_t001_02, sequence_fspl_t001_01, sequence_pl_t001_02, sequence_pl_t001_01, sequence_xpl_t001_02, sequence_xpl_t001_01, output_folder, output_file):
-    # Get the list of files in the specified folder and initialize empty lists to store data frames
-    files = os.listdir(folder_path)
-    data_frames_fspl = []
-    data_frames_fspl_t001_01 = []
-    data_frames_pl_t001_02 = []
-    data_frames_pl_t001_01 = []
-    data_frames_xpl_t001_02 = []
-    data_frames_xpl_t001_01 = []
-
-    for substring in sequence_fspl_t001_02:
-        for file in files:
-            if substring in file:
-                file_path = os.path.join(folder_path, file)
-                if is_zipfile(file_path):
-                    df = pd.read_excel(file_path, engine='openpyxl', header=None)
-                    df = df.iloc[:, :6]  # Keep only the first six columns
-                    data_frames_fspl.append(df)
-
-    for substring in sequence_fspl_t001_01:
-        for file in files:
-            if substring in file:
-                file_path = os.path.join(folder_path, file)
-                if is_zipfile(file_path):
-                    df = pd.read_excel(file_path, engine='openpyxl', header=None)
-                    df = df.iloc[:, 5:6]  # Keep only the 6th column
-                    data_frames_fspl_t001_01.append(df)
-
-    for substring in sequence_pl_t001_02:
-        for file in files:
-            if substring in file:
-                file_path = os.path.join(folder_path, file)
-                if is_zipfile(file_path):
-                    df = pd.read_excel(file_path, engine='openpyxl', header=None)
-                    df = df.iloc[:, 5:6]  # Keep only the 6th column
-                    data_frames_pl_t001_02.append(df)
-
-    for substring in sequence_pl_t001_01:
-        for file in files:
-            if substring in file:
-                file_path = os.path.join(folder_path, file)
-                if is_zipfile(file_path):
-                    df = pd.read_excel(file_path, engine='openpyxl', header=None)
-                    df = df.iloc[:, 5:6]  # Keep only the 6th column
-                    data_frames_pl_t001_01.append(df)
-
-    for substring in sequence_xpl_t001_02:
-        for file in files:
-            if substring in file:
-                file_path = os.path.join(folder_path, file)
-                if is_zipfile(file_path):
-                    df = pd.read_excel(file_path, engine='openpyxl', header=None)
-                    df = df.iloc[:, 5:6]  # Keep only the 6th column
-                    data_frames_xpl_t001_02.append(df)
-
-    for substring in sequence_xpl_t001_01:
-        for file in files:
-            if substring in file:
-                file_path = os.path.join(folder_path, file)
-                if is_zipfile(file_path):
-                    df = pd.read_excel(file_path, engine='openpyxl', header=None)
-                    df = df.iloc[:, 5:6]  # Keep only the 6th column
-                    data_frames_xpl_t001_01.append(df)
-    
-    # Concatenate the data frames for each sequence and then altogether
-    merged_data_fspl = pd.concat(data_frames_fspl, ignore_index=True)
-    merged_data_fspl_t001_01 = pd.concat(data_frames_fspl_t001_01, ignore_index=True)
-    merged_data_pl_t001_02 = pd.concat(data_frames_pl_t001_02, ignore_index=True)
-    merged_data_pl_t001_01 = pd.concat(data_frames_pl_t001_01, ignore_index=True)
-    merged_data_xpl_t001_02 = pd.concat(data_frames_xpl_t001_02, ignore_index=True)
-    merged_data_xpl_t001_01 = pd.concat(data_frames_xpl_t001_01, ignore_index=True)
-    merged_data = pd.concat([merged_data_fspl, merged_data_fspl_t001_01, merged_data_pl_t001_02, merged_data_pl_t001_01, merged_data_xpl_t001_02, merged_data_xpl_t001_01], axis=1)
+# This function creates a Loss_ sheet by merging specific columns from Excel files based on provided sequences, saves it to a new Excel file and returns it
+# sequences_fspl, sequences_pl and sequences_xpl hold one sequence per transmitter (TX1 first)
+def create_loss_sheet(folder_path, substrings, sequences_fspl, sequences_pl, sequences_xpl, output_folder, output_file, file_index=None, executor=None):
+    # Look up the Excel files of the sequences in the file index
+    if file_index is None:
+        file_index = build_file_index(folder_path)
+
+    # Keep the first six columns of the first FSPL sequence and only the 6th column of every other sequence, FSPL of all transmitters first, then PL, then XPL
+    merged_columns = []
+    for position, sequence in enumerate(list(sequences_fspl) + list(sequences_pl) + list(sequences_xpl)):
+        data_frames = []
+        for file, df in read_excel_sequence(folder_path, file_index, sequence, executor):
+            data_frames.append(df.iloc[:, :6] if position == 0 else df.iloc[:, 5:6])
+        merged_columns.append(pd.concat(data_frames, ignore_index=True))
+    merged_data = pd.concat(merged_columns, axis=1)
 
     # Create the output folder path and save the merged data to an Excel file
     output_folder_path = os.path.join(folder_path, output_folder)
     output_file_path = os.path.join(output_folder_path, output_file)
     merged_data.to_excel(output_file_path, index=False, header=False)
-
-# This function creates a Power_ sheet by merging specific columns from Excel files based on provided sequences and saves it to a new Excel file
-def create_power_sheet(folder_path, substrings, sequence_power_t001_02, sequence_power_t001_01, output_folder, output_file):
-    # Get the list of files in the specified folder and initialize an empty list to store data frames for TX1 and TX2
-    files = os.listdir(folder_path)
-    data_frames_power_t001_02 = []
-    data_frames_power_t001_01 = []
-
-    for sequence in [sequence_power_t001_02, sequence_power_t001_01]:
-        for substring in sequence:
-            for file in files:
-                if substring in file:
-                    file_path = os.path.join(folder_path, file)
-                    if is_zipfile(file_path):
-                        if sequence == sequence_power_t001_02:
-                            # Read the Excel file as a data frame and append it to the list for power_t001_02
-                            df = pd.read_excel(file_path, engine='openpyxl', header=None)
-                            data_frames_power_t001_02.append(df)
-                        elif sequence == sequence_power_t001_01:
-                            # Read the Excel file as a data frame and keep only the last two columns
-                            df_full = pd.read_excel(file_path, engine='openpyxl', header=None)
-                            df = df_full.iloc[:, -2:]
-                            data_frames_power_t001_01.append(df)
-
-    # Concatenate the data frames 
-    merged_data_power_t001_02 = pd.concat(data_frames_power_t001_02, ignore_index=True)
-    merged_data_power_t001_01 = pd.concat(data_frames_power_t001_01, ignore_index=True)
-    merged_data = pd.concat([merged_data_power_t001_02, merged_data_power_t001_01], axis=1)
+    return merged_data
+
+# This function creates a Power_ sheet by merging specific columns from Excel files based on provided sequences, saves it to a new Excel file and returns it
+# sequences_power holds one sequence per transmitter (TX1 first)
+def create_power_sheet(folder_path, substrings, sequences_power, output_folder, output_file, file_index=None, executor=None):
+    # Look up the Excel files of the sequences in the file index
+    if file_index is None:
+        file_index = build_file_index(folder_path)
+
+    # Keep all columns of the first transmitter and only the last two columns (power and phase) of the others
+    merged_columns = []
+    for position, sequence in enumerate(sequences_power):
+        data_frames = []
+        for file, df in read_excel_sequence(folder_path, file_index, sequence, executor):
+            data_frames.append(df if position == 0 else df.iloc[:, -2:])
+        merged_columns.append(pd.concat(data_frames, ignore_index=True))
+    merged_data = pd.concat(merged_columns, axis=1)
 
     # Create output folder path and save merged data to an Excel file
     output_folder_path = os.path.join(folder_path, output_folder)
@@ -225,135 +184,754 @@ def create_power_sheet(folder_path, substrings, sequence_power_t001_02, sequence
 
     output_file_path = os.path.join(output_folder_path, output_file)
     merged_data.to_excel(output_file_path, index=False, header=False)
+    return merged_data
+
+# This function lays out a parsed nested file (DOA, DOD, ...) like its Excel file: a row <point> <number of paths> per receiver followed by one row per path
+def paths_to_rows(paths):
+    n_receivers = len(paths.receiver)
+    path_counts = np.diff(paths.offsets)
+    rows = np.full((n_receivers + len(paths.path), paths.values.shape[1] + 1), np.nan)
+
+    header_rows = paths.offsets[:-1] + np.arange(n_receivers)
+    rows[header_rows, 0] = paths.receiver
+    rows[header_rows, 1] = path_counts
+
+    path_rows = np.arange(len(paths.path)) + np.repeat(np.arange(1, n_receivers + 1), path_counts)
+    rows[path_rows, 0] = paths.path
+    rows[path_rows, 1:] = paths.values
+    return rows
+
+# This function puts 2D arrays side by side and pads the shorter ones with NaN rows (like pd.concat with axis=1)
+def concat_columns(arrays):
+    n_rows = max(len(array) for array in arrays)
+    return np.hstack([np.vstack([array, np.full((n_rows - len(array), array.shape[1]), np.nan)]) for array in arrays])
+
+# This function parses a nested .p2m file, writes its receiver -> path arrays to the columnar cache with the signature the file had before it was parsed, and returns that signature
+# The arrays are read back memory-mapped (see read_p2m_paths_cache), so a worker process does not send them back
+def cache_p2m_paths(file_path, cache_path):
+    source = source_signature(file_path)
+    write_p2m_paths(cache_path, os.path.basename(file_path), read_p2m_paths(file_path), source)
+    return source
+
+# This function parses the .p2m files of several sequences with the given reader and returns the results of each sequence in its order
+# All files are handed to the executor (if given) in one go, so the workers are not held up by the end of every sequence
+# If cache_path is given (nested files only), the receiver -> path arrays are memory-mapped from the columnar cache; files cached while unchanged (e.g. by the watch mode) are not parsed again
+def read_p2m_sequences(folder_path, file_index, sequences, reader, executor=None, cache_path=None):
+    files = [lookup_files(file_index, sequence) for sequence in sequences]
+    all_files = [file for sequence_files in files for file in sequence_files]
+    file_paths = [os.path.join(folder_path, file) for file in all_files]
+    if cache_path is None:
+        results = map_files(reader, file_paths, executor=executor)
+    else:
+        missing = [file_path for file, file_path in zip(all_files, file_paths) if read_p2m_paths_cache(cache_path, file, source_signature(file_path)) is None]
+        map_files(cache_p2m_paths, missing, [cache_path] * len(missing), executor=executor)
+        results = [read_p2m_paths_cache(cache_path, file) for file in all_files]
+    ends = np.cumsum([len(sequence_files) for sequence_files in files])
+    return [results[end - len(sequence_files):end] for sequence_files, end in zip(files, ends.tolist())]
+
+# This function parses the .p2m files of one sequence (see read_p2m_sequences)
+def read_p2m_sequence(folder_path, file_index, sequence, reader, executor=None, cache_path=None):
+    return read_p2m_sequences(folder_path, file_index, [sequence], reader, executor, cache_path)[0]
+
+# This function merges the DOA and DOD files of one transmitter in memory, giving the same table as merge_excel_files
+def merge_p2m_data(folder_path, sequence_doa, sequence_dod, file_index=None, executor=None, cache_path=None):
+    if file_index is None:
+        file_index = build_file_index(folder_path)
+    parsed_doa, parsed_dod = read_p2m_sequences(folder_path, file_index, [sequence_doa, sequence_dod], read_p2m_paths, executor, cache_path)
+    data_doa = [paths_to_rows(paths)[:, :4] for paths in parsed_doa]
+    data_dod = []
+    for paths in parsed_dod:
+        rows = paths_to_rows(paths)[:, 1:3]
+        # The first receiver row of each DOD file is replaced by an empty row
+        rows[0] = np.nan
+        data_dod.append(rows)
+
+    merged_data = concat_columns([np.vstack(data_doa), np.vstack(data_dod)])
+
+    # Remove empty columns
+    return merged_data[:, ~np.all(np.isnan(merged_data), axis=0)]
+
+# This function reads the flat files of several sequences in one go and stacks the files of each sequence in its order, keeping the given columns of each sequence
+def stack_p2m_tables(folder_path, file_index, sequences, columns, executor=None):
+    tables = read_p2m_sequences(folder_path, file_index, sequences, read_p2m_table, executor)
+    return [np.vstack([table[:, sequence_columns] for table in sequence_tables]) for sequence_tables, sequence_columns in zip(tables, columns)]
+
+# This function creates the Loss_ table in memory, giving the same table as create_loss_sheet
+def merge_p2m_loss(folder_path, sequences_fspl, sequences_pl, sequences_xpl, file_index=None, executor=None):
+    if file_index is None:
+        file_index = build_file_index(folder_path)
+    sequences = list(sequences_fspl) + list(sequences_pl) + list(sequences_xpl)
+    return concat_columns(stack_p2m_tables(folder_path, file_index, sequences, [slice(None, 6) if position == 0 else slice(5, 6) for position in range(len(sequences))], executor))
+
+# This function creates the Power_ table in memory, giving the same table as create_power_sheet
+def merge_p2m_power(folder_path, sequences_power, file_index=None, executor=None):
+    if file_index is None:
+        file_index = build_file_index(folder_path)
+    return concat_columns(stack_p2m_tables(folder_path, file_index, sequences_power, [slice(None) if position == 0 else slice(-2, None) for position in range(len(sequences_power))], executor))
+
+# This function computes the channel statistics of every receiver of several transmitters from their nested files and returns one table per transmitter
+# Each entry of sequences_stats maps a metric, e.g. 'cir', to its sequence; the files of all transmitters are parsed in one go
+# sequences_power holds the power sequence of each transmitter, whose flat files give the number of receivers of every receiver set
+# If cache_path is given, the parsed receiver -> path arrays (cir, doppler, ...) are also written to the columnar cache
+def merge_channel_statistics(folder_path, sequences_stats, sequences_power, file_index=None, executor=None, cache_path=None):
+    if file_index is None:
+        file_index = build_file_index(folder_path)
+    n_receivers = read_p2m_sequences(folder_path, file_index, sequences_power, count_p2m_rows, executor)
+    parsed = read_p2m_sequences(folder_path, file_index, [sequence for stats_sequences in sequences_stats for sequence in stats_sequences.values()], read_p2m_paths, executor, cache_path)
+    ends = np.cumsum([len(stats_sequences) for stats_sequences in sequences_stats]).tolist()
+    return [stack_channel_statistics(dict(zip(stats_sequences, parsed[end - len(stats_sequences):end])), tx_receivers) for stats_sequences, end, tx_receivers in zip(sequences_stats, ends, n_receivers)]
+
+# This function computes the channel statistics of every receiver of one transmitter (parsed maps a metric to the parsed files of its sequence)
+# n_receivers holds the number of receivers of every receiver set; receivers without paths (or missing from the nested files) get NaN
+# The receiver sets are reduced one at a time, all receivers of a set at once; the rows follow the rows of Power_ and Loss_
+def stack_channel_statistics(parsed, n_receivers):
+    blocks = []
+    for rx_paths, rx_receivers in zip(zip(*parsed.values()), n_receivers):
+        paths = dict(zip(parsed, rx_paths))
+        receiver = rx_paths[0].receiver
+        if receiver.max(initial=0) > rx_receivers:
+            raise ValueError(f'The nested files have receiver point {receiver.max()} but the flat files of the receiver set have only {rx_receivers} receivers')
+
+        # Receiver point numbers start at 1, like the rows of the flat files of the set
+        block = np.full(rx_receivers, np.nan, dtype=CHANNEL_STATS_DTYPE)
+        block[receiver - 1] = channel_statistics(**paths)
+        blocks.append(block)
+    return np.concatenate(blocks)
+
+# This function returns the Power_ column (received power) and the Loss_ column (path loss) of every transmitter for n_tx transmitters
+def tx_columns(n_tx):
+    tx = np.arange(n_tx)
+    return 5 + 2 * tx, 5 + n_tx + tx
+
+# DataTX columns of the angle matrices, in the order Rx azimuth, Rx elevation, Tx azimuth, Tx elevation
+ANGLE_COLUMNS = ['rx_phi', 'rx_theta', 'tx_phi', 'tx_theta']
+
+# This function returns the columns the MATLAB files of every transmitter are built from, as views into the merged tables (2D arrays laid out like the merged Excel sheets)
+# Each transmitter gets the DataTX columns by name, its Power_ column as total_power and its Loss_ column as loss
+def table_transmitters(data_tx, Power_, Loss_):
+    power_columns, loss_columns = tx_columns(len(data_tx))
+    return [{**{column: data[:, i] for i, column in enumerate(DATA_TX_COLUMNS)}, 'total_power': Power_[:, power_column], 'loss': Loss_[:, loss_column]} for data, power_column, loss_column in zip(data_tx, power_columns, loss_columns)]
+
+# This function reads the same columns of n_tx transmitters straight from the columnar cache (memory-mapped, the tables are not copied)
+def cached_transmitters(cache_path, n_tx):
+    transmitters = []
+    for tx in range(1, n_tx + 1):
+        columns = read_table_columns(cache_path, f'DataTX{tx}_', ANGLE_COLUMNS + ['power'])
+        columns['total_power'] = read_table_columns(cache_path, 'Power_', [f'power_tx{tx}'])[f'power_tx{tx}']
+        columns['loss'] = read_table_columns(cache_path, 'Loss_', [f'pl_tx{tx}'])[f'pl_tx{tx}']
+        transmitters.append(columns)
+    return transmitters
+
+# Default size of the (square) receiver grid of the MATLAB matrices
+GRID_SIZE = 350
+
+# Receiver locations and the specified location of their data in the merged sheets
+RX_POSITIONS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'RXMatPositions350.xlsx')
+
+# This function loads the receiver locations and the specified location of their data in the merged sheets from 'RXMatPositions350.xlsx' (or another table laid out the same way)
+def load_rx_positions(rx_positions_file=RX_POSITIONS_FILE):
+    RXMatPositions350 = pd.read_excel(rx_positions_file, header=None)
 
-# This function creates finally MATLAB files (output files for further post-processing) from the Excel files in the specified folder
-def ray_tracer_format(merged_data_file_path):
-    # Load receiver location and the specified location of the data stored in excel sheets from 'RXMatPositions350.xlsx'
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    file_path = os.path.join(script_dir, 'RXMatPositions350.xlsx')
-    RXMatPositions350 = pd.read_excel(file_path, header=None)
-    
     # ReceiverID (Name of RX), Mat_row (RX position in 350x350 matrix), Mat_col (RX position in 350x350 matrix), rows_from (begin in DataTX1_), rows_end (begin in DataTX1_), positionloss (row of Loss power)  
     RXMatPositions350.columns = ['ReceiverID', 'Mat_row', 'Mat_col', 'rows from', 'rows end', 'positionloss']
-    values = RXMatPositions350.iloc[:, 1:].values
+    return RXMatPositions350
+
+# This function returns the names of the merged DataTX tables (DataTX1_, DataTX2_, ...) of n_tx transmitters
+def data_tx_names(n_tx):
+    return [f'DataTX{tx}_' for tx in range(1, n_tx + 1)]
+
+# This function counts the consecutive DataTX tables (DataTX1_, DataTX2_, ...) among the file names of a folder
+def count_data_tx(files, extension=''):
+    n_tx = 0
+    while f'DataTX{n_tx + 1}_{extension}' in files:
+        n_tx += 1
+    return n_tx
 
-    # Load the rest of the Excel files
-    file_path_dataTX1_ = os.path.join(merged_data_file_path, 'DataTX1_.xlsx')
-    DataTX1_ = pd.read_excel(file_path_dataTX1_, header=None).values
-    file_path_dataTX2_ = os.path.join(merged_data_file_path, 'DataTX2_.xlsx')
-    DataTX2_ = pd.read_excel(file_path_dataTX2_, header=None).values
+# This function creates finally MATLAB files (output files for further post-processing) from the Excel files in the specified folder
+# If cache_path is given, the merged tables are loaded from the columnar cache instead of the Excel files; stats optionally holds the channel statistics of each transmitter
+# layout, float32, compress and grid_size select how the MATLAB files are stored (see write_ray_tracer_files)
+def ray_tracer_format(merged_data_file_path, cache_path=None, stacked=False, tx_sets=None, stats=None, rx_positions_file=RX_POSITIONS_FILE, layout='dense', float32=False, compress=False, grid_size=GRID_SIZE):
+    if cache_path is not None:
+        transmitters = cached_transmitters(cache_path, count_data_tx(set(os.listdir(cache_path))))
+        write_ray_tracer_files(merged_data_file_path, transmitters, stacked=stacked, tx_sets=tx_sets, stats=stats, rx_positions_file=rx_positions_file, layout=layout, float32=float32, compress=compress, grid_size=grid_size)
+        return
+
+    # Load the merged Excel files
+    n_tx = count_data_tx(set(os.listdir(merged_data_file_path)), '.xlsx')
+    data_tx = [pd.read_excel(os.path.join(merged_data_file_path, name + '.xlsx'), header=None).values for name in data_tx_names(n_tx)]
     file_path_Power_ = os.path.join(merged_data_file_path, 'Power_.xlsx')
     Power_ = pd.read_excel(file_path_Power_, header=None).values
     file_path_Loss_ = os.path.join(merged_data_file_path, 'Loss_.xlsx')
     Loss_ = pd.read_excel(file_path_Loss_, header=None).values
 
-    # Initialize the matrices with zeros
-    Tx_AziAngle_insite = np.zeros((350, 350, 25))
-    Tx_EleAngle_insite = np.zeros((350, 350, 25))
-    Rx_AziAngle_insite = np.zeros((350, 350, 25))
-    Rx_EleAngle_insite = np.zeros((350, 350, 25))
-
-    # Save angular values in matrices for TX1
-    for ii in range(len(RXMatPositions350)):
-        Rx_AziAngle_insite[values[ii,0], values[ii,1]] = DataTX1_[values[ii,2]:values[ii,3]+1,1]
-        Rx_EleAngle_insite[values[ii,0], values[ii,1]] = DataTX1_[values[ii,2]:values[ii,3]+1,2]
-        Tx_AziAngle_insite[values[ii,0], values[ii,1]] = DataTX1_[values[ii,2]:values[ii,3]+1,4]
-        Tx_EleAngle_insite[values[ii,0], values[ii,1]] = DataTX1_[values[ii,2]:values[ii,3]+1,5] 
-
-    # Save variables into a .mat file
-    file_path_Tx1Rx_Angles = os.path.join(merged_data_file_path, 'Tx1Rx_Angles_insitefin.mat')
-    savemat(file_path_Tx1Rx_Angles, {'Tx_EleAngle_insite': Tx_EleAngle_insite, 'Tx_AziAngle_insite': Tx_AziAngle_insite, 'Rx_EleAngle_insite': Rx_EleAngle_insite, 'Rx_AziAngle_insite': Rx_AziAngle_insite})
-
-    # Save angular values in matrices for TX2
-    for kk in range(len(RXMatPositions350)):
-        Rx_AziAngle_insite[values[kk,0], values[kk,1]] = DataTX2_[values[kk,2]:values[kk,3]+1,1]
-        Rx_EleAngle_insite[values[kk,0], values[kk,1]] = DataTX2_[values[kk,2]:values[kk,3]+1,2]
-        Tx_AziAngle_insite[values[kk,0], values[kk,1]] = DataTX2_[values[kk,2]:values[kk,3]+1,4]
-        Tx_EleAngle_insite[values[kk,0], values[kk,1]] = DataTX2_[values[kk,2]:values[kk,3]+1,5]
-
-    # Save variables into a .mat file
-    file_path_Tx2Rx_Angles = os.path.join(merged_data_file_path, 'Tx2Rx_Angles_insitefin.mat')
-    savemat(file_path_Tx2Rx_Angles, {'Tx_EleAngle_insite': Tx_EleAngle_insite, 'Tx_AziAngle_insite': Tx_AziAngle_insite, 'Rx_EleAngle_insite': Rx_EleAngle_insite, 'Rx_AziAngle_insite': Rx_AziAngle_insite})
-
-    # Create total power matrix
-    Rx_TotalPower_dBm_Matrix_insite = np.zeros((350,350))
-    for ll in range(len(RXMatPositions350)):
-        Rx_TotalPower_dBm_Matrix_insite[values[ll,0]-1, values[ll,1]-1] = Power_[values[ll,4]-1,6]
-
-    # Initialize power matrix with zeros    
-    Receiver_Ray_insite = np.zeros((350,350), dtype={'names':('Power_dBm','TotalPower_mW','TotalPower_dBm','Ray_count','Loss_dB'),'formats':('f8','f8','f8','i4','f8')})
-                                   
-    # Save power values for TX1
-    for pp in range(len(RXMatPositions350)):
-        Receiver_Ray_insite[values[pp,0]-1, values[pp,1]-1]['Power_dBm'] = np.mean(DataTX1_[values[pp,2]:values[pp,3]+1,3])
-        Receiver_Ray_insite[values[pp,0]-1, values[pp,1]-1]['TotalPower_mW'] = 10**((abs(Power_[values[pp,4]-1,7])-30)/10)
-        Receiver_Ray_insite[values[pp,0]-1, values[pp,1]-1]['TotalPower_dBm'] = Power_[values[pp,4]-1,7]
-        Receiver_Ray_insite[values[pp,0]-1, values[pp,1]-1]['Ray_count'] = values[pp,3]-values[pp,2]+1
-        Receiver_Ray_insite[values[pp,0]-1, values[pp,1]-1]['Loss_dB'] = Loss_[values[pp,4]-1,7]
-
-    # Save variables into a .mat file
-    file_path_SimRecTX1 = os.path.join(merged_data_file_path, 'SimulationRecord_insiteTX1fin.mat')
-    savemat(file_path_SimRecTX1, {'Receiver_Ray_insite': Receiver_Ray_insite, 'Rx_TotalPower_dBm_Matrix_insite': Rx_TotalPower_dBm_Matrix_insite})
-
-    # Save power values for TX2
-    for hh in range(len(RXMatPositions350)):
-        Receiver_Ray_insite[values[hh,0]-1, values[hh,1]-1]['Power_dBm'] = np.mean(DataTX2_[values[hh,2]:values[hh,3]+1,3])
-        Receiver_Ray_insite[values[hh,0]-1, values[hh,1]-1]['TotalPower_mW'] = 10**((abs(Power_[values[hh,4]-1,7])-30)/10)
-        Receiver_Ray_insite[values[hh,0]-1, values[hh,1]-1]['TotalPower_dBm'] = Power_[values[hh,4]-1,7]
-        Receiver_Ray_insite[values[hh,0]-1, values[hh,1]-1]['Ray_count'] = values[hh,3]-values[hh,2]+1
-        Receiver_Ray_insite[values[hh,0]-1, values[hh,1]-1]['Loss_dB'] = Loss_[values[hh,4]-1,8]
-
-    # Save variables into a .mat file
-    file_path_SimRecTX2 = os.path.join(merged_data_file_path, 'SimulationRecord_insiteTX2fin.mat')
-    savemat(file_path_SimRecTX2, {'Receiver_Ray_insite': Receiver_Ray_insite, 'Rx_TotalPower_dBm_Matrix_insite': Rx_TotalPower_dBm_Matrix_insite})
-
-def main():
-    # Specify location for saving and what kind of data you want to store (DOA, DOD, FSPL, PL, Power, XPL or other types from Wireless InSite)
-    folder_path = r'C:\Users\Athavan\Desktop\Code\emulate-code-insite\InSiteOutput'
-    substrings = ['.dod.', '.doa.', '.fspl.', '.pl.', '.power.', '.xpl.']
-
-    sequence_doa_t001_02 = ['.doa.t001_02.r010', '.doa.t001_02.r009', '.doa.t001_02.r007', '.doa.t001_02.r011']
-    sequence_dod_t001_02 = ['.dod.t001_02.r010', '.dod.t001_02.r009', '.dod.t001_02.r007', '.dod.t001_02.r011']
-    sequence_doa_t001_01 = ['.doa.t001_01.r010', '.doa.t001_01.r009', '.doa.t001_01.r007', '.doa.t001_01.r011']
-    sequence_dod_t001_01 = ['.dod.t001_01.r010', '.dod.t001_01.r009', '.dod.t001_01.r007', '.dod.t001_01.r011']
+    write_ray_tracer_files(merged_data_file_path, table_transmitters(data_tx, Power_, Loss_), stacked=stacked, tx_sets=tx_sets, stats=stats, rx_positions_file=rx_positions_file, layout=layout, float32=float32, compress=compress, grid_size=grid_size)
+
+# Fields of the Receiver_Ray_insite struct matrix
+RECEIVER_RAY_DTYPE = {'names': ('Power_dBm', 'TotalPower_mW', 'TotalPower_dBm', 'Ray_count', 'Loss_dB'), 'formats': ('f8', 'f8', 'f8', 'i4', 'f8')}
+
+# This function returns the fields of the Receiver_Ray_insite struct matrix, followed by the channel statistics fields if they are written; with float32 the floating point fields are single precision
+def receiver_ray_dtype(statistics=False, float32=False):
+    dtype = RECEIVER_RAY_DTYPE
+    if statistics:
+        dtype = {'names': dtype['names'] + CHANNEL_STATS_DTYPE.names, 'formats': dtype['formats'] + tuple(CHANNEL_STATS_DTYPE[name].str for name in CHANNEL_STATS_DTYPE.names)}
+    if float32:
+        dtype = {'names': dtype['names'], 'formats': tuple('f4' if np.dtype(dtype_format).kind == 'f' else dtype_format for dtype_format in dtype['formats'])}
+    return dtype
+
+# Gather/scatter indices of the receivers in the position table: per receiver (mat_row ... position_loss) and per ray (receiver, ray, data_row)
+RxScatterIndex = namedtuple('RxScatterIndex', ['mat_row', 'mat_col', 'rows_from', 'ray_count', 'position_loss', 'receiver', 'ray', 'data_row'])
+
+# This function builds the flat gather/scatter indices of all receivers from the position table once
+def build_rx_scatter_index(values):
+    values = np.asarray(values, dtype=np.int64).reshape(-1, 5)
+    mat_row, mat_col, rows_from, rows_end, position_loss = values.T
+    ray_count = rows_end - rows_from + 1
+
+    # Receiver and ray number of every ray, and the row of the ray in DataTX
+    ray_offsets = np.concatenate(([0], np.cumsum(ray_count)))
+    receiver = np.repeat(np.arange(len(values)), ray_count)
+    ray = np.arange(ray_offsets[-1]) - ray_offsets[receiver]
+    return RxScatterIndex(mat_row, mat_col, rows_from, ray_count, position_loss, receiver, ray, rows_from[receiver] + ray)
+
+# This function checks that all receivers of the position table fit into the receiver grid
+# The angle matrices are indexed with Mat_row/Mat_col as given and the records with Mat_row-1/Mat_col-1, so both must lie between 1 and grid_size-1
+def check_grid_size(index, grid_size):
+    positions = np.concatenate((index.mat_row, index.mat_col))
+    if len(positions) and (positions.min() < 1 or positions.max() >= grid_size):
+        raise ValueError(f'The receiver positions (Mat_row/Mat_col from {positions.min()} to {positions.max()}) do not fit into a {grid_size}x{grid_size} grid; Mat_row and Mat_col must lie between 1 and {grid_size - 1}')
+
+# This function averages the rays of every receiver for a stack of columns (one row per transmitter) with a single segment reduction
+def segment_mean(columns, index):
+    # Segments [rows_from, rows_from + ray_count) interleaved with the gaps between them; a padding column keeps every bound inside the array
+    bounds = np.column_stack((index.rows_from, index.rows_from + index.ray_count)).ravel()
+    padded = np.concatenate((columns, np.zeros((len(columns), 1))), axis=1)
+    sums = np.add.reduceat(padded, bounds, axis=1)[:, ::2]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(index.ray_count > 0, sums / index.ray_count, np.nan)
+
+# This function gathers the values of the occupied cells only: the angles of every ray (transmitter x angle x ray, angles in the order Rx azimuth, Rx elevation, Tx azimuth, Tx elevation),
+# the record of every receiver (transmitter x receiver) and its total power, without allocating any grid matrix
+# transmitters holds the columns of each transmitter (see table_transmitters and cached_transmitters); only the rows of the occupied cells are read
+# stats optionally holds the channel statistics of each transmitter (rows like Power_), which are added as extra fields of the records
+def build_ray_tracer_records(values, transmitters, stats=None, float32=False):
+    index = build_rx_scatter_index(values)
+    if len({len(columns['power']) for columns in transmitters}) > 1:
+        raise ValueError('The DataTX tables of all transmitters must have the same shape (same receiver sets and ray counts)')
+    n_tx = len(transmitters)
+    float_dtype = np.float32 if float32 else np.float64
+
+    rays = np.empty((n_tx, len(ANGLE_COLUMNS), len(index.data_row)), dtype=float_dtype)
+    for tx, columns in enumerate(transmitters):
+        for angle, column in enumerate(ANGLE_COLUMNS):
+            rays[tx, angle] = np.asarray(columns[column][index.data_row], dtype=np.float64)
+
+    power_row = index.position_loss - 1
+    total_power = np.array([np.asarray(columns['total_power'][power_row], dtype=np.float64) for columns in transmitters]).reshape(n_tx, -1)
+    records = np.zeros((n_tx, len(index.mat_row)), dtype=receiver_ray_dtype(stats is not None, float32))
+    records['Power_dBm'] = segment_mean(np.array([np.asarray(columns['power'], dtype=np.float64) for columns in transmitters]).reshape(n_tx, -1), index)
+    records['TotalPower_mW'] = 10**((np.abs(total_power)-30)/10)
+    records['TotalPower_dBm'] = total_power
+    records['Ray_count'] = index.ray_count
+    records['Loss_dB'] = [columns['loss'][power_row] for columns in transmitters]
+    if stats is not None:
+        stats = np.stack([np.asarray(tx_stats)[power_row] for tx_stats in stats])
+        for name in CHANNEL_STATS_DTYPE.names:
+            records[name] = stats[name]
+
+    return index, rays, records, total_power.astype(float_dtype, copy=False)
+
+# This function scatters the gathered values of one transmitter (see build_ray_tracer_records) into its angle matrices, receiver records and total power matrix
+# out optionally holds the matrices to fill (e.g. those of the previous transmitter, or the slices of stacked matrices); all transmitters occupy the same cells, so they are overwritten without clearing
+def build_ray_tracer_outputs(index, rays, records, total_power, grid_size=GRID_SIZE, depth=None, out=None):
+    if out is None:
+        if depth is None:
+            depth = int(index.ray_count.max()) if len(index.ray_count) else 0
+        out = (np.zeros((4, grid_size, grid_size, depth), dtype=rays.dtype), np.zeros((grid_size, grid_size), dtype=records.dtype), np.zeros((grid_size, grid_size), dtype=total_power.dtype))
+    angles, Receiver_Ray_insite, Rx_TotalPower_dBm_Matrix_insite = out
+
+    # Angle matrices Rx_AziAngle_insite, Rx_EleAngle_insite, Tx_AziAngle_insite, Tx_EleAngle_insite (indexed with Mat_row/Mat_col as given)
+    angles[:, index.mat_row[index.receiver], index.mat_col[index.receiver], index.ray] = rays
+
+    # Receiver records and total power matrix (indexed with Mat_row-1/Mat_col-1)
+    Receiver_Ray_insite[index.mat_row - 1, index.mat_col - 1] = records
+    Rx_TotalPower_dBm_Matrix_insite[index.mat_row - 1, index.mat_col - 1] = total_power
+    return out
+
+# This function returns the variables of the angle and the record file of one transmitter with the grid matrices as MATLAB sparse matrices (double, only the occupied cells are stored)
+# MATLAB sparse matrices are 2-D, so each angle matrix is stored as (grid_size*grid_size) x depth with the grid cells in column-major order: reshape(full(A), Grid_Size, Grid_Size, []) restores the dense matrix
+# Receiver_Ray_insite is a scalar struct whose fields are sparse grid matrices
+def sparse_ray_tracer_variables(index, rays, records, total_power, grid_size):
+    depth = int(index.ray_count.max()) if len(index.ray_count) else 0
+    cell = index.mat_row[index.receiver] + index.mat_col[index.receiver] * grid_size
+    Rx_AziAngle_insite, Rx_EleAngle_insite, Tx_AziAngle_insite, Tx_EleAngle_insite = [csc_matrix((np.asarray(angle, dtype=np.float64), (cell, index.ray)), shape=(grid_size * grid_size, depth)) for angle in rays]
+
+    # This function returns a sparse grid matrix holding one value per receiver (indexed with Mat_row-1/Mat_col-1)
+    def grid_matrix(column):
+        return csc_matrix((np.asarray(column, dtype=np.float64), (index.mat_row - 1, index.mat_col - 1)), shape=(grid_size, grid_size))
+
+    Receiver_Ray_insite = {name: grid_matrix(records[name]) for name in records.dtype.names}
+    angle_variables = {'Tx_EleAngle_insite': Tx_EleAngle_insite, 'Tx_AziAngle_insite': Tx_AziAngle_insite, 'Rx_EleAngle_insite': Rx_EleAngle_insite, 'Rx_AziAngle_insite': Rx_AziAngle_insite, 'Grid_Size': grid_size}
+    record_variables = {'Receiver_Ray_insite': Receiver_Ray_insite, 'Rx_TotalPower_dBm_Matrix_insite': grid_matrix(total_power), 'Grid_Size': grid_size}
+    return angle_variables, record_variables
+
+# This function returns the variables of the angle and the record file of one or more transmitters as coordinate lists (one row per ray or receiver, one column per transmitter)
+# Ray_Mat_row/Ray_Mat_col/Ray_Number and Rx_Mat_row/Rx_Mat_col are the MATLAB subscripts of the values in the dense angle matrices and record matrices
+# rays, records and total_power have the transmitter as the first axis
+def coo_ray_tracer_variables(index, rays, records, total_power, grid_size):
+    Rx_AziAngle_insite, Rx_EleAngle_insite, Tx_AziAngle_insite, Tx_EleAngle_insite = np.moveaxis(rays, 0, -1)
+    Receiver_Ray_insite = {name: records[name].T for name in records.dtype.names}
+    angle_variables = {'Tx_EleAngle_insite': Tx_EleAngle_insite, 'Tx_AziAngle_insite': Tx_AziAngle_insite, 'Rx_EleAngle_insite': Rx_EleAngle_insite, 'Rx_AziAngle_insite': Rx_AziAngle_insite,
+                       'Ray_Mat_row': (index.mat_row[index.receiver] + 1)[:, None], 'Ray_Mat_col': (index.mat_col[index.receiver] + 1)[:, None], 'Ray_Number': (index.ray + 1)[:, None], 'Grid_Size': grid_size}
+    record_variables = {'Receiver_Ray_insite': Receiver_Ray_insite, 'Rx_TotalPower_dBm_Matrix_insite': total_power.T,
+                        'Rx_Mat_row': index.mat_row[:, None], 'Rx_Mat_col': index.mat_col[:, None], 'Grid_Size': grid_size}
+    return angle_variables, record_variables
+
+# Number of transmitters whose rays and records are gathered together; the dense grid matrices are still filled one transmitter at a time
+TX_BATCH = 8
+
+# Layouts of the MATLAB files: dense grid matrices (as iNETS reads them), MATLAB sparse matrices, or coordinate lists of the occupied cells
+MAT_LAYOUTS = ('dense', 'sparse', 'coo')
+
+# This function checks that a combination of MATLAB file options can be written
+def check_mat_options(layout='dense', stacked=False, float32=False):
+    if layout not in MAT_LAYOUTS:
+        raise ValueError(f'Unknown MATLAB file layout {layout!r} (expected one of {", ".join(MAT_LAYOUTS)})')
+    if layout == 'sparse' and stacked:
+        raise ValueError('MATLAB sparse matrices are 2-D, so the sparse layout cannot stack the transmitters (use the coo layout)')
+    if layout == 'sparse' and float32:
+        raise ValueError('MATLAB sparse matrices are always double, so the sparse layout cannot be combined with float32')
+
+# This function returns the names of the MATLAB files written for n_tx transmitters, either one angle and one record file per transmitter or one stacked file of each
+def ray_tracer_file_names(n_tx, stacked=False):
+    if stacked:
+        return ['TxRx_Angles_insitefin.mat', 'SimulationRecord_insitefin.mat']
+    return [f'Tx{tx}Rx_Angles_insitefin.mat' for tx in range(1, n_tx + 1)] + [f'SimulationRecord_insiteTX{tx}fin.mat' for tx in range(1, n_tx + 1)]
+
+# This function creates the MATLAB files from the columns of all transmitters (see table_transmitters and cached_transmitters)
+# Without stacked, one angle file and one record file are written per transmitter (only the files named in outputs, if given); with stacked, the transmitters are stacked along the last axis of two files
+# If stats (channel statistics of each transmitter) is given, the statistics are written as extra fields of Receiver_Ray_insite
+# layout selects dense grid matrices of grid_size x grid_size cells, sparse matrices or coordinate lists (see MAT_LAYOUTS); float32 writes single precision values and compress compresses the variables
+def write_ray_tracer_files(merged_data_file_path, transmitters, outputs=None, stacked=False, tx_sets=None, stats=None, rx_positions_file=RX_POSITIONS_FILE, layout='dense', float32=False, compress=False, grid_size=GRID_SIZE):
+    check_mat_options(layout, stacked, float32)
+    RXMatPositions350 = load_rx_positions(rx_positions_file)
+    values = RXMatPositions350.iloc[:, 1:].values
+    index = build_rx_scatter_index(values)
+    check_grid_size(index, grid_size)
+    n_tx = len(transmitters)
+    Tx_Sets = np.array(tx_sets if tx_sets is not None else [f'TX{tx}' for tx in range(1, n_tx + 1)], dtype=object)
+    save = partial(savemat, do_compression=compress)
+
+    # Only build the transmitters that have a file to write
+    selected = list(range(n_tx)) if stacked else [tx for tx in range(n_tx) if outputs is None or f'Tx{tx + 1}Rx_Angles_insitefin.mat' in outputs or f'SimulationRecord_insiteTX{tx + 1}fin.mat' in outputs]
+
+    if layout != 'dense':
+        # Gather the occupied cells of all transmitters at once; no grid matrix is allocated
+        batch = np.array(selected, dtype=np.int64)
+        index, rays, records, total_power = build_ray_tracer_records(values, [transmitters[tx] for tx in batch], stats=None if stats is None else [stats[tx] for tx in batch], float32=float32)
+        if stacked:
+            angle_variables, record_variables = coo_ray_tracer_variables(index, rays, records, total_power, grid_size)
+            save(os.path.join(merged_data_file_path, 'TxRx_Angles_insitefin.mat'), {**angle_variables, 'Tx_Sets': Tx_Sets})
+            save(os.path.join(merged_data_file_path, 'SimulationRecord_insitefin.mat'), {**record_variables, 'Tx_Sets': Tx_Sets})
+            return
+        for position, tx in enumerate(batch):
+            if layout == 'sparse':
+                angle_variables, record_variables = sparse_ray_tracer_variables(index, rays[position], records[position], total_power[position], grid_size)
+            else:
+                angle_variables, record_variables = coo_ray_tracer_variables(index, rays[position:position + 1], records[position:position + 1], total_power[position:position + 1], grid_size)
+            if outputs is None or f'Tx{tx + 1}Rx_Angles_insitefin.mat' in outputs:
+                save(os.path.join(merged_data_file_path, f'Tx{tx + 1}Rx_Angles_insitefin.mat'), angle_variables)
+            if outputs is None or f'SimulationRecord_insiteTX{tx + 1}fin.mat' in outputs:
+                save(os.path.join(merged_data_file_path, f'SimulationRecord_insiteTX{tx + 1}fin.mat'), record_variables)
+        return
+
+    # The records of TX_BATCH transmitters are gathered at once, then scattered into the grid matrices one transmitter at a time
+    depth = int(index.ray_count.max()) if len(index.ray_count) else 0
+    float_dtype = np.float32 if float32 else np.float64
+    if stacked:
+        # Fill the stacked matrices transmitter by transmitter, with the transmitter as the last axis
+        stacked_angles = np.zeros((4, grid_size, grid_size, depth, n_tx), dtype=float_dtype)
+        stacked_records = np.zeros((grid_size, grid_size, n_tx), dtype=receiver_ray_dtype(stats is not None, float32))
+        stacked_total_power = np.zeros((grid_size, grid_size, n_tx), dtype=float_dtype)
+        for start in range(0, n_tx, TX_BATCH):
+            batch = np.arange(start, min(start + TX_BATCH, n_tx))
+            index, rays, records, total_power = build_ray_tracer_records(values, [transmitters[tx] for tx in batch], stats=None if stats is None else [stats[tx] for tx in batch], float32=float32)
+            for position, tx in enumerate(batch):
+                build_ray_tracer_outputs(index, rays[position], records[position], total_power[position], out=(stacked_angles[..., tx], stacked_records[..., tx], stacked_total_power[..., tx]))
+        Rx_AziAngle_insite, Rx_EleAngle_insite, Tx_AziAngle_insite, Tx_EleAngle_insite = stacked_angles
+
+        # Save variables into .mat files
+        file_path_TxRx_Angles = os.path.join(merged_data_file_path, 'TxRx_Angles_insitefin.mat')
+        save(file_path_TxRx_Angles, {'Tx_EleAngle_insite': Tx_EleAngle_insite, 'Tx_AziAngle_insite': Tx_AziAngle_insite, 'Rx_EleAngle_insite': Rx_EleAngle_insite, 'Rx_AziAngle_insite': Rx_AziAngle_insite, 'Tx_Sets': Tx_Sets})
+        file_path_SimRec = os.path.join(merged_data_file_path, 'SimulationRecord_insitefin.mat')
+        save(file_path_SimRec, {'Receiver_Ray_insite': stacked_records, 'Rx_TotalPower_dBm_Matrix_insite': stacked_total_power, 'Tx_Sets': Tx_Sets})
+        return
+
+    # Build the selected transmitters one at a time into the same matrices
+    out = None
+    for start in range(0, len(selected), TX_BATCH):
+        batch = np.array(selected[start:start + TX_BATCH])
+        index, rays, records, total_power = build_ray_tracer_records(values, [transmitters[tx] for tx in batch], stats=None if stats is None else [stats[tx] for tx in batch], float32=float32)
+
+        for position, tx in enumerate(batch):
+            out = build_ray_tracer_outputs(index, rays[position], records[position], total_power[position], grid_size, depth, out)
+            angles, Receiver_Ray_insite, Rx_TotalPower_dBm_Matrix_insite = out
+            Rx_AziAngle_insite, Rx_EleAngle_insite, Tx_AziAngle_insite, Tx_EleAngle_insite = angles
+
+            # Save variables into .mat files
+            if outputs is None or f'Tx{tx + 1}Rx_Angles_insitefin.mat' in outputs:
+                file_path_TxRx_Angles = os.path.join(merged_data_file_path, f'Tx{tx + 1}Rx_Angles_insitefin.mat')
+                save(file_path_TxRx_Angles, {'Tx_EleAngle_insite': Tx_EleAngle_insite, 'Tx_AziAngle_insite': Tx_AziAngle_insite, 'Rx_EleAngle_insite': Rx_EleAngle_insite, 'Rx_AziAngle_insite': Rx_AziAngle_insite})
+            if outputs is None or f'SimulationRecord_insiteTX{tx + 1}fin.mat' in outputs:
+                file_path_SimRec = os.path.join(merged_data_file_path, f'SimulationRecord_insiteTX{tx + 1}fin.mat')
+                save(file_path_SimRec, {'Receiver_Ray_insite': Receiver_Ray_insite, 'Rx_TotalPower_dBm_Matrix_insite': Rx_TotalPower_dBm_Matrix_insite})
+
+# This function yields the columns of a paths MATLAB file chunk by chunk from a list of .paths files (Path_FirstPoint and Point_Interaction are 1-based for MATLAB)
+def paths_file_columns(file_paths, chunk_bytes=1 << 22):
+    points = 0
+    for file_path in file_paths:
+        rx_set = int(parse_file_name(os.path.basename(file_path)).rx[1:])
+        file_points = 0
+        for receivers, paths, chunk_points in iter_paths_chunks(file_path, chunk_bytes):
+            yield {
+                'Rx_Set': np.full(receivers.size, rx_set, dtype=np.int32),
+                'Rx_Point': receivers['receiver'],
+                'Rx_NumPaths': receivers['n_paths'],
+                'Rx_Power_dBm': receivers['power'],
+                'Rx_MeanToA_s': receivers['mean_toa'],
+                'Rx_DelaySpread_s': receivers['delay_spread'],
+                'Path_Rx_Set': np.full(paths.size, rx_set, dtype=np.int32),
+                'Path_Rx_Point': paths['receiver'],
+                'Path_Number': paths['path'],
+                'Path_NumInteractions': paths['n_interactions'],
+                'Path_Power_dBm': paths['power'],
+                'Path_Phase_deg': paths['phase'],
+                'Path_ToA_s': paths['toa'],
+                'Path_ArrivalTheta_deg': paths['arrival_theta'],
+                'Path_ArrivalPhi_deg': paths['arrival_phi'],
+                'Path_DepartureTheta_deg': paths['departure_theta'],
+                'Path_DeparturePhi_deg': paths['departure_phi'],
+                'Path_FirstPoint': points + paths['first_point'] + 1,
+                'Point_Interaction': chunk_points['interaction'] + 1,
+                'Point_X': chunk_points['x'],
+                'Point_Y': chunk_points['y'],
+                'Point_Z': chunk_points['z'],
+            }
+            file_points += chunk_points.size
+        points += file_points
+
+# This function streams the .paths files of one transmitter into a MATLAB file of receiver, path and interaction point columns with bounded memory
+def write_paths_file(mat_file_path, file_paths, chunk_bytes=1 << 22):
+    write_mat_columns(mat_file_path, paths_file_columns(file_paths, chunk_bytes), {'InteractionTypes': np.array(INTERACTION_TYPES, dtype=object)})
+
+# Metrics needed to create the MATLAB files; the transmitter and receiver sets are discovered from their files
+METRICS = ('doa', 'dod', 'fspl', 'pl', 'xpl', 'power')
+
+# Nested metrics the channel statistics are computed from (the delays and phases come from the cir files, so the toa files are not needed)
+STATS_METRICS = ('cir', 'doppler', 'doa', 'dod')
+
+# Order of the transmitter sets (TX1, TX2, ...) and of the receiver sets in the merged tables and RXMatPositions350.xlsx (Walk1, Walk2, Walk3, Extra Receivers)
+# Sets that are not listed here follow in sorted order
+TX_SET_ORDER = ['t001_02', 't001_01']
+RX_SET_ORDER = ['r010', 'r009', 'r007', 'r011']
+
+def main(folder_path=r'C:\Users\Athavan\Desktop\Code\emulate-code-insite\InSiteOutput', in_memory=True, export_excel=False, workers=1, force=False, use_hash=False, paths=False, stacked=False, statistics=False, profile=False, cprofile=False, trace_memory=False, rx_positions_file=RX_POSITIONS_FILE, layout='dense', float32=False, compress=False, grid_size=GRID_SIZE, tx_sets=None, rx_sets=None, delete_files=True):
+    # Specify what kind of data you want to store (DOA, DOD, FSPL, PL, Power, XPL or other types from Wireless InSite)
+    substrings = ['.dod.', '.doa.', '.fspl.', '.pl.', '.power.', '.xpl.'] + (['.paths.'] if paths else []) + (['.cir.', '.doppler.'] if statistics else [])
+
     merge_output_folder = 'merged_data'
-    merge_output_file_dataTX1 = 'DataTX1_.xlsx'
-    merge_output_file_dataTX2 = 'DataTX2_.xlsx'
-
-    # Delete unnecessary files created by Wireless InSite from folder
-    delete_unwanted_files(folder_path, substrings)
-    merge_excel_files(folder_path, substrings, sequence_doa_t001_02, sequence_dod_t001_02, merge_output_folder, merge_output_file_dataTX1)
-    merge_excel_files(folder_path, substrings, sequence_doa_t001_01, sequence_dod_t001_01, merge_output_folder, merge_output_file_dataTX2)
-
-    # Read the merged files, adjust the data by correcting some offsets, and save the adjusted data
-    output_file_path1 = os.path.join(folder_path, merge_output_folder, merge_output_file_dataTX1)
-    output_file_path2 = os.path.join(folder_path, merge_output_folder, merge_output_file_dataTX2)
-    dataTX1_fin = pd.read_excel(output_file_path1, header=None, engine='openpyxl')
-    dataTX2_fin = pd.read_excel(output_file_path2, header=None, engine='openpyxl')
-    adjusted_dataTX1_fin = adjust_data(dataTX1_fin)
-    adjusted_dataTX2_fin = adjust_data(dataTX2_fin)
-    adjusted_dataTX1_fin.to_excel(output_file_path1, index=False, header=False)
-    adjusted_dataTX2_fin.to_excel(output_file_path2, index=False, header=False)
-
-    # Create the Loss_ sheet
-    sequence_fspl_t001_02 = ['.fspl.t001_02.r010', '.fspl.t001_02.r009', '.fspl.t001_02.r007', '.fspl.t001_02.r011']
-    sequence_fspl_t001_01 = ['.fspl.t001_01.r010', '.fspl.t001_01.r009', '.fspl.t001_01.r007', '.fspl.t001_01.r011']
-    sequence_pl_t001_02 = ['.pl.t001_02.r010', '.pl.t001_02.r009', '.pl.t001_02.r007', '.pl.t001_02.r011']
-    sequence_pl_t001_01 = ['.pl.t001_01.r010', '.pl.t001_01.r009', '.pl.t001_01.r007', '.pl.t001_01.r011']
-    sequence_xpl_t001_02 = ['.xpl.t001_02.r010', '.xpl.t001_02.r009', '.xpl.t001_02.r007', '.xpl.t001_02.r011']
-    sequence_xpl_t001_01 = ['.xpl.t001_01.r010', '.xpl.t001_01.r009', '.xpl.t001_01.r007', '.xpl.t001_01.r011']
     merge_output_file_loss = 'Loss_.xlsx'
-    create_loss_sheet(folder_path, substrings, sequence_fspl_t001_02, sequence_fspl_t001_01, sequence_pl_t001_02, sequence_pl_t001_01, sequence_xpl_t001_02, sequence_xpl_t001_01, merge_output_folder, merge_output_file_loss)
-
-    # Create the Power_ sheet
-    sequence_power_t001_02 = ['.power.t001_02.r010', '.power.t001_02.r009', '.power.t001_02.r007', '.power.t001_02.r011']
-    sequence_power_t001_01 = ['.power.t001_01.r010', '.power.t001_01.r009', '.power.t001_01.r007', '.power.t001_01.r011']
     merge_output_file_power = 'Power_.xlsx'
-    create_power_sheet(folder_path, substrings, sequence_power_t001_02, sequence_power_t001_01, merge_output_folder, merge_output_file_power)
-
-    # Change the Excel files into iNETS ray-tracing compatible format (MATLAB files)
     merged_data_file_path = os.path.join(folder_path, merge_output_folder)
-    ray_tracer_format(merged_data_file_path)
+    cache_path = os.path.join(folder_path, CACHE_FOLDER)
+    rx_positions_file = os.path.abspath(rx_positions_file)
+    check_mat_options(layout, stacked, float32)
+
+    # Options the MATLAB files are written with; the files are rebuilt when they change
+    mat_options = {'layout': layout, 'float32': float32, 'compress': compress, 'grid_size': grid_size}
+
+    # Index the output folder once, discover the transmitter and receiver sets (unless tx_sets / rx_sets limit the run to given sets), and stop before any work if a file is missing or duplicated
+    file_index = build_file_index(folder_path)
+    found_tx_sets, found_rx_sets = discover_sets(file_index, METRICS)
+    tx_sets = sorted(set(tx_sets)) if tx_sets else found_tx_sets
+    rx_sets = sorted(set(rx_sets)) if rx_sets else found_rx_sets
+    if not tx_sets or not rx_sets:
+        raise ValueError(f'No Wireless InSite output files found in {folder_path}')
+    tx_sets = order_sets(tx_sets, TX_SET_ORDER)
+    rx_sets = order_sets(rx_sets, RX_SET_ORDER)
+    print(f'Transmitter sets: {", ".join(tx_sets)}; receiver sets: {", ".join(rx_sets)}')
+
+    # One sequence per transmitter set (TX1 first) for every metric
+    sequences_doa = [build_sequence('doa', tx, rx_sets) for tx in tx_sets]
+    sequences_dod = [build_sequence('dod', tx, rx_sets) for tx in tx_sets]
+    sequences_fspl = [build_sequence('fspl', tx, rx_sets) for tx in tx_sets]
+    sequences_pl = [build_sequence('pl', tx, rx_sets) for tx in tx_sets]
+    sequences_xpl = [build_sequence('xpl', tx, rx_sets) for tx in tx_sets]
+    sequences_power = [build_sequence('power', tx, rx_sets) for tx in tx_sets]
+    sequences_paths = [build_sequence('paths', tx, rx_sets) for tx in tx_sets]
+    sequences_stats = [{metric: build_sequence(metric, tx, rx_sets) for metric in STATS_METRICS} for tx in tx_sets]
+    sequences = sequences_doa + sequences_dod + sequences_fspl + sequences_pl + sequences_xpl + sequences_power
+
+    # The .paths files and the statistics are always read from the .p2m files, so their sequences are not checked for Excel files
+    p2m_sequences = sequences + (sequences_paths if paths else [])
+    if statistics:
+        p2m_sequences += [sequence for tx_sequences in sequences_stats for sequence in tx_sequences.values()]
+    check_file_index(file_index, p2m_sequences)
+    data_names = data_tx_names(len(tx_sets))
+    stats_names = [f'ChannelStatsTX{tx}_' for tx in range(1, len(tx_sets) + 1)] if statistics else []
+    stats_inputs = [lookup_files(file_index, [entry for sequence in tx_sequences.values() for entry in sequence] + sequence_power) for tx_sequences, sequence_power in zip(sequences_stats, sequences_power)] if statistics else []
+    loss_sequences = [entry for sequence in sequences_fspl + sequences_pl + sequences_xpl for entry in sequence]
+    power_sequences = [entry for sequence in sequences_power for entry in sequence]
+
+    # Load the manifest of the previous run, or start from an empty one for a forced full rebuild
+    manifest = new_manifest() if force else load_manifest(merged_data_file_path)
+
+    # This function checks if an output (path relative to folder_path) is missing or older than its inputs according to the manifest
+    def outdated(output, inputs, options=None):
+        return not is_up_to_date(manifest, folder_path, output, inputs, use_hash, options)
+
+    # This function records in the manifest that an output was rebuilt from its inputs (and with which options)
+    def record(output, inputs, options=None):
+        record_output(manifest, folder_path, output, inputs, use_hash, options)
+
+    # This function checks if the Excel file of a .p2m file is missing or outdated
+    def conversion_outdated(file_path):
+        file = os.path.basename(file_path)
+        return outdated(os.path.splitext(file)[0] + '.xlsx', [file])
+
+    # MATLAB files and the merged tables each of them is created from (the records also from the channel statistics, if they are written)
+    if stacked:
+        mat_tables = {'TxRx_Angles_insitefin.mat': data_names + ['Loss_', 'Power_'], 'SimulationRecord_insitefin.mat': data_names + ['Loss_', 'Power_'] + stats_names}
+    else:
+        mat_tables = {}
+        for tx, name in enumerate(data_names, start=1):
+            mat_tables[f'Tx{tx}Rx_Angles_insitefin.mat'] = [name]
+            mat_tables[f'SimulationRecord_insiteTX{tx}fin.mat'] = [name, 'Loss_', 'Power_'] + stats_names[tx - 1:tx]
+
+    # Measure every stage that runs if profiling is enabled; the report is saved to merged_data when the run finishes
+    profile = new_profile(os.path.join(merged_data_file_path, 'profile') if cprofile else None, trace_memory) if profile or cprofile or trace_memory else None
+
+    # This function saves and prints the profile report
+    def finish_profile():
+        if profile is not None:
+            save_profile(profile, os.path.join(merged_data_file_path, PROFILE_FILE))
+            print_profile(profile)
+
+    # This function returns the paths of files relative to folder_path
+    def in_folder(files):
+        return [os.path.join(folder_path, file) for file in files]
+
+    # Parse and convert the files in a process pool when more than one worker is requested
+    with ProcessPoolExecutor(max_workers=workers) if workers > 1 else nullcontext() as executor:
+        # Delete unnecessary files created by Wireless InSite from folder (the in-memory mode reads the .p2m files directly, so nothing is converted)
+        # With delete_files False (the watch mode, while the simulation may still be writing) the files are kept
+        converted = []
+        if delete_files or not in_memory:
+            with profile_stage(profile, 'delete_unwanted_files') as stage:
+                converted = delete_unwanted_files(folder_path, substrings, convert_to_excel=not in_memory, executor=executor, convert_filter=conversion_outdated, delete=delete_files)
+                count_files(stage, converted, [os.path.splitext(file_path)[0] + '.xlsx' for file_path in converted])
+        for file_path in converted:
+            file = os.path.basename(file_path)
+            record(os.path.splitext(file)[0] + '.xlsx', [file])
+        os.makedirs(merged_data_file_path, exist_ok=True)
+        save_manifest(merged_data_file_path, manifest)
+
+        # Stream the .paths files of each transmitter into a MATLAB file next to the angle matrices
+        if paths:
+            for tx, sequence_paths in enumerate(sequences_paths, start=1):
+                output = os.path.join(merge_output_folder, f'Tx{tx}Rx_Paths_insitefin.mat')
+                inputs = lookup_files(file_index, sequence_paths)
+                if outdated(output, inputs):
+                    with profile_stage(profile, f'write_paths_file TX{tx}') as stage:
+                        write_paths_file(os.path.join(folder_path, output), in_folder(inputs))
+                        count_files(stage, in_folder(inputs), in_folder([output]))
+                    record(output, inputs)
+                    save_manifest(merged_data_file_path, manifest)
+
+        if in_memory:
+            # This function adjusts the merged DOA and DOD data of one transmitter by correcting some offsets
+            def adjust_table(table):
+                return adjust_data(pd.DataFrame(table)).values
+
+            # Parse the nested files of all outdated DataTX tables into the cache in one go, so the pool is not held up by the end of every transmitter
+            outdated_data = [tx for tx, name in enumerate(data_names) if outdated(os.path.join(CACHE_FOLDER, name, COLUMNS_FILE), lookup_files(file_index, sequences_doa[tx] + sequences_dod[tx]))]
+            if len(outdated_data) > 1:
+                with profile_stage(profile, 'read_p2m_sequences') as stage:
+                    sequences_data = [sequence for tx in outdated_data for sequence in (sequences_doa[tx], sequences_dod[tx])]
+                    read_p2m_sequences(folder_path, file_index, sequences_data, read_p2m_paths, executor, cache_path)
+                    count_files(stage, in_folder(lookup_files(file_index, [entry for sequence in sequences_data for entry in sequence])))
+
+            # Merged tables, kept in the columnar cache next to merged_data and rebuilt from the .p2m files only when one of their inputs changed
+            tables = [(name, sequences_doa[tx] + sequences_dod[tx], 'merge_p2m_data', partial(merge_p2m_data, folder_path, sequences_doa[tx], sequences_dod[tx], file_index, executor, cache_path)) for tx, name in enumerate(data_names)]
+            tables += [
+                ('Loss_', loss_sequences, 'merge_p2m_loss', partial(merge_p2m_loss, folder_path, sequences_fspl, sequences_pl, sequences_xpl, file_index, executor)),
+                ('Power_', power_sequences, 'merge_p2m_power', partial(merge_p2m_power, folder_path, sequences_power, file_index, executor)),
+            ]
+            merged_tables = {}
+            for name, table_sequences, merge_name, merge in tables:
+                output = os.path.join(CACHE_FOLDER, name, COLUMNS_FILE)
+                inputs = lookup_files(file_index, table_sequences)
+                if outdated(output, inputs):
+                    with profile_stage(profile, f'{merge_name} {name}') as stage:
+                        merged_tables[name] = merge()
+                        count_files(stage, in_folder(inputs))
+                        stage['rows'] = len(merged_tables[name])
+                    if name in data_names:
+                        with profile_stage(profile, f'adjust_data {name}') as stage:
+                            merged_tables[name] = adjust_table(merged_tables[name])
+                            stage['rows'] = len(merged_tables[name])
+                    with profile_stage(profile, f'write_table {name}') as stage:
+                        write_table(cache_path, name, merged_tables[name])
+                        count_files(stage, written=[os.path.join(cache_path, name)])
+                        stage['rows'] = len(merged_tables[name])
+                    record(output, inputs)
+                    save_manifest(merged_data_file_path, manifest)
+
+            # Channel statistics of each transmitter, cached like the merged tables; the outdated transmitters are computed together
+            outdated_stats = [tx for tx, name in enumerate(stats_names) if outdated(os.path.join(CACHE_FOLDER, name, COLUMNS_FILE), stats_inputs[tx])]
+            if outdated_stats:
+                with profile_stage(profile, 'merge_channel_statistics') as stage:
+                    for tx, table in zip(outdated_stats, merge_channel_statistics(folder_path, [sequences_stats[tx] for tx in outdated_stats], [sequences_power[tx] for tx in outdated_stats], file_index, executor, cache_path)):
+                        merged_tables[stats_names[tx]] = table
+                        write_records(cache_path, stats_names[tx], table)
+                    count_files(stage, in_folder([file for tx in outdated_stats for file in stats_inputs[tx]]), [os.path.join(cache_path, stats_names[tx]) for tx in outdated_stats])
+                    stage['rows'] = sum(len(merged_tables[stats_names[tx]]) for tx in outdated_stats)
+                for tx in outdated_stats:
+                    record(os.path.join(CACHE_FOLDER, stats_names[tx], COLUMNS_FILE), stats_inputs[tx])
+                save_manifest(merged_data_file_path, manifest)
+
+            # This function returns a merged table, loading it from the cache if it was up to date
+            def merged_table(name):
+                if name not in merged_tables:
+                    merged_tables[name] = read_records(cache_path, name) if name in stats_names else read_table(cache_path, name)
+                return merged_tables[name]
+
+            if export_excel:
+                # Optionally keep the merged Excel sheets as a side output
+                for name in data_names + ['Loss_', 'Power_']:
+                    output = os.path.join(merge_output_folder, name + '.xlsx')
+                    inputs = [os.path.join(CACHE_FOLDER, name, COLUMNS_FILE)]
+                    if outdated(output, inputs):
+                        with profile_stage(profile, f'export_excel {name}') as stage:
+                            pd.DataFrame(merged_table(name)).to_excel(os.path.join(folder_path, output), index=False, header=False)
+                            count_files(stage, written=in_folder([output]))
+                            stage['rows'] = len(merged_table(name))
+                        record(output, inputs)
+                save_manifest(merged_data_file_path, manifest)
+
+            # Change the merged data into iNETS ray-tracing compatible format (MATLAB files), writing only the files whose tables changed
+            mat_inputs = {mat: [os.path.join(CACHE_FOLDER, name, COLUMNS_FILE) for name in names] + [rx_positions_file] for mat, names in mat_tables.items()}
+            outdated_mats = [mat for mat in mat_tables if outdated(os.path.join(merge_output_folder, mat), mat_inputs[mat], mat_options)]
+            if outdated_mats:
+                with profile_stage(profile, 'write_ray_tracer_files') as stage:
+                    stats = [merged_table(name) for name in stats_names] if statistics else None
+                    transmitters = cached_transmitters(cache_path, len(data_names))
+                    write_ray_tracer_files(merged_data_file_path, transmitters, outputs=outdated_mats, stacked=stacked, tx_sets=tx_sets, stats=stats, rx_positions_file=rx_positions_file, **mat_options)
+                    count_files(stage, [rx_positions_file], [os.path.join(merged_data_file_path, mat) for mat in outdated_mats])
+                    stage['rows'] = len(transmitters[0]['total_power'])
+                for mat in outdated_mats:
+                    record(os.path.join(merge_output_folder, mat), mat_inputs[mat], mat_options)
+                save_manifest(merged_data_file_path, manifest)
+            finish_profile()
+            return profile
+
+        # Index the converted Excel files
+        file_index = build_file_index(folder_path)
+        check_file_index(file_index, sequences, 'xlsx')
+
+        # Merge the DOA and DOD files of each transmitter, adjust the data by correcting some offsets, and save the adjusted data
+        for name, sequence_doa, sequence_dod in zip(data_names, sequences_doa, sequences_dod):
+            output = os.path.join(merge_output_folder, name + '.xlsx')
+            inputs = lookup_files(file_index, sequence_doa + sequence_dod, 'xlsx')
+            if outdated(output, inputs):
+                with profile_stage(profile, f'merge_excel_files {name}') as stage:
+                    merged_data = merge_excel_files(folder_path, substrings, sequence_doa, sequence_dod, merge_output_folder, name + '.xlsx', file_index, executor)
+                    count_files(stage, in_folder(inputs), in_folder([output]))
+                    stage['rows'] = len(merged_data)
+                with profile_stage(profile, f'adjust_data {name}') as stage:
+                    output_file_path = os.path.join(folder_path, output)
+                    adjusted_data = adjust_data(pd.read_excel(output_file_path, header=None, engine='openpyxl'))
+                    adjusted_data.to_excel(output_file_path, index=False, header=False)
+                    count_files(stage, [output_file_path], [output_file_path])
+                    stage['rows'] = len(adjusted_data)
+                record(output, inputs)
+                save_manifest(merged_data_file_path, manifest)
+
+        # Create the Loss_ sheet
+        output = os.path.join(merge_output_folder, merge_output_file_loss)
+        inputs = lookup_files(file_index, loss_sequences, 'xlsx')
+        if outdated(output, inputs):
+            with profile_stage(profile, 'create_loss_sheet') as stage:
+                merged_data = create_loss_sheet(folder_path, substrings, sequences_fspl, sequences_pl, sequences_xpl, merge_output_folder, merge_output_file_loss, file_index, executor)
+                count_files(stage, in_folder(inputs), in_folder([output]))
+                stage['rows'] = len(merged_data)
+            record(output, inputs)
+            save_manifest(merged_data_file_path, manifest)
+
+        # Create the Power_ sheet
+        output = os.path.join(merge_output_folder, merge_output_file_power)
+        inputs = lookup_files(file_index, power_sequences, 'xlsx')
+        if outdated(output, inputs):
+            with profile_stage(profile, 'create_power_sheet') as stage:
+                merged_data = create_power_sheet(folder_path, substrings, sequences_power, merge_output_folder, merge_output_file_power, file_index, executor)
+                count_files(stage, in_folder(inputs), in_folder([output]))
+                stage['rows'] = len(merged_data)
+            record(output, inputs)
+            save_manifest(merged_data_file_path, manifest)
+
+        # Change the Excel files into iNETS ray-tracing compatible format (MATLAB files), with the channel statistics computed from the nested .p2m files
+        inputs = [os.path.join(merge_output_folder, name + '.xlsx') for name in data_names + ['Loss_', 'Power_']] + [rx_positions_file] + [file for tx_inputs in stats_inputs for file in tx_inputs]
+        if any(outdated(os.path.join(merge_output_folder, mat), inputs, mat_options) for mat in mat_tables):
+            if statistics:
+                with profile_stage(profile, 'merge_channel_statistics') as stage:
+                    stats = merge_channel_statistics(folder_path, sequences_stats, sequences_power, file_index, executor)
+                    count_files(stage, in_folder([file for tx_inputs in stats_inputs for file in tx_inputs]))
+                    stage['rows'] = sum(len(tx_stats) for tx_stats in stats)
+            else:
+                stats = None
+            with profile_stage(profile, 'ray_tracer_format') as stage:
+                ray_tracer_format(merged_data_file_path, stacked=stacked, tx_sets=tx_sets, stats=stats, rx_positions_file=rx_positions_file, **mat_options)
+                count_files(stage, in_folder(inputs[:len(data_names) + 2]) + [rx_positions_file], [os.path.join(merged_data_file_path, mat) for mat in mat_tables])
+            for mat in mat_tables:
+                record(os.path.join(merge_output_folder, mat), inputs, mat_options)
+            save_manifest(merged_data_file_path, manifest)
+    finish_profile()
+    return profile
+
+# This function parses the command line options of the script
+def parse_args():
+    parser = argparse.ArgumentParser(description='Convert Wireless InSite output files into iNETS ray-tracing compatible MATLAB files')
+    parser.add_argument('--folder', default=r'C:\Users\Athavan\Desktop\Code\emulate-code-insite\InSiteOutput', help='folder containing the Wireless InSite output files')
+    parser.add_argument('--excel-pipeline', action='store_true', help='convert every file to Excel and merge the Excel files (previous behaviour) instead of working in memory')
+    parser.add_argument('--export-excel', action='store_true', help='in the in-memory mode, also save the merged DataTX1_, DataTX2_, Loss_ and Power_ Excel sheets')
+    parser.add_argument('--workers', type=int, default=1, help='number of worker processes for parsing and converting files (0 uses all CPU cores)')
+    parser.add_argument('--force', action='store_true', help='rebuild all outputs even if the manifest says they are up to date')
+    parser.add_argument('--hash', action='store_true', help='compare the content hash of files whose size or modification time changed instead of rebuilding right away')
+    parser.add_argument('--stacked', action='store_true', help='write one TxRx_Angles_insitefin.mat and one SimulationRecord_insitefin.mat with the transmitters stacked along the last axis instead of one file per transmitter')
+    parser.add_argument('--paths', action='store_true', help='keep the .paths files and stream them into Tx1Rx_Paths_insitefin.mat and Tx2Rx_Paths_insitefin.mat')
+    parser.add_argument('--statistics', action='store_true', help='keep the .cir and .doppler files and add the channel statistics of every receiver (delay, angular and Doppler spread, K-factor, coherent and incoherent power) to Receiver_Ray_insite')
+    parser.add_argument('--profile', action='store_true', help='measure the wall and CPU time, peak RSS, bytes, files and rows of every stage and save them to merged_data/profile_report.json')
+    parser.add_argument('--cprofile', action='store_true', help='also run every stage under cProfile and save one .prof file per stage to merged_data/profile (implies --profile)')
+    parser.add_argument('--tracemalloc', action='store_true', help='also trace the Python memory allocations of every stage and list the largest allocation sites in the report (implies --profile)')
+    parser.add_argument('--rx-positions', default=RX_POSITIONS_FILE, help='receiver position table laid out like RXMatPositions350.xlsx (default: RXMatPositions350.xlsx next to the script)')
+    parser.add_argument('--layout', choices=MAT_LAYOUTS, default='dense', help='store the MATLAB matrices as dense grid matrices (default), as MATLAB sparse matrices, or as coordinate lists (coo) of the occupied cells only')
+    parser.add_argument('--float32', action='store_true', help='write the angles, records and total power in single precision (dense and coo layouts)')
+    parser.add_argument('--compress', action='store_true', help='compress the variables of the MATLAB files')
+    parser.add_argument('--grid-size', type=int, default=GRID_SIZE, help='size of the square receiver grid of the MATLAB matrices (default: 350)')
+    parser.add_argument('--watch', action='store_true', help='watch the folder while Wireless InSite is running, parse every .p2m file as soon as it is fully written, and write the MATLAB files once all expected files are there')
+    parser.add_argument('--tx-sets', nargs='+', help='only process these transmitter sets (default: the sets found in the folder); the watch mode waits for them (default: the sets of TX_SET_ORDER)')
+    parser.add_argument('--rx-sets', nargs='+', help='only process these receiver sets (default: the sets found in the folder); the watch mode waits for them (default: the sets of RX_SET_ORDER)')
+    parser.add_argument('--poll-interval', type=float, default=1.0, help='seconds between two scans of the folder in watch mode')
+    parser.add_argument('--settle-time', type=float, default=2.0, help='seconds the size and modification time of a file must stay unchanged before the watch mode parses it')
+    parser.add_argument('--keep-watching', action='store_true', help='keep watching after the MATLAB files are written and rebuild them whenever the expected files change again')
+    parser.add_argument('--watch-timeout', type=float, help='seconds the watch mode waits for missing files before it stops with an error')
+    return parser.parse_args()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    args = parse_args()
+    options = dict(in_memory=not args.excel_pipeline, export_excel=args.export_excel, workers=args.workers or os.cpu_count(), force=args.force, use_hash=args.hash, paths=args.paths, stacked=args.stacked, statistics=args.statistics, profile=args.profile, cprofile=args.cprofile, trace_memory=args.tracemalloc, rx_positions_file=args.rx_positions, layout=args.layout, float32=args.float32, compress=args.compress, grid_size=args.grid_size)
+    if args.watch:
+        # The watch mode imports this module, so it is only loaded when it is used
+        from watch_insite import watch_folder
+        asyncio.run(watch_folder(args.folder, args.tx_sets, args.rx_sets, poll_interval=args.poll_interval, settle_time=args.settle_time, keep_watching=args.keep_watching, timeout=args.watch_timeout, **options))
+    else:
+        main(args.folder, tx_sets=args.tx_sets, rx_sets=args.rx_sets, **options)
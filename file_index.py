@@ -0,0 +1,77 @@
+import os
+import re
+from collections import namedtuple
+
+# Wireless InSite output file names: <project>.<metric>.<transmitter set>.<receiver set>.<extension>, e.g. AachenSuperC_60GHz.doa.t001_02.r010.p2m
+FILE_NAME_PATTERN = re.compile(r'^(?P<project>.+)\.(?P<metric>[A-Za-z0-9]+)\.(?P<tx>t\d+_\d+)\.(?P<rx>r\d+)\.(?P<ext>[A-Za-z0-9]+)$')
+
+# Sequence entries used by main(), e.g. '.doa.t001_02.r010'
+SEQUENCE_PATTERN = re.compile(r'^\.(?P<metric>[A-Za-z0-9]+)\.(?P<tx>t\d+_\d+)\.(?P<rx>r\d+)$')
+
+# One indexed output file
+FileEntry = namedtuple('FileEntry', ['project', 'metric', 'tx', 'rx', 'ext', 'file'])
+
+# This function parses a Wireless InSite output file name and returns None if the name does not follow the pattern
+def parse_file_name(file_name):
+    match = FILE_NAME_PATTERN.match(file_name)
+    if match is None:
+        return None
+    return FileEntry(file=file_name, **match.groupdict())
+
+# This function parses a sequence entry like '.doa.t001_02.r010' into its (metric, transmitter set, receiver set) key
+def parse_sequence_entry(entry):
+    match = SEQUENCE_PATTERN.match(entry)
+    if match is None:
+        raise ValueError(f'Invalid sequence entry: {entry!r} (expected something like ".doa.t001_02.r010")')
+    return match.group('metric'), match.group('tx'), match.group('rx')
+
+# This function scans a folder once and indexes all output files by (metric, transmitter set, receiver set, extension)
+def build_file_index(folder_path):
+    index = {}
+    for file in sorted(os.listdir(folder_path)):
+        entry = parse_file_name(file)
+        if entry is not None:
+            index.setdefault((entry.metric, entry.tx, entry.rx, entry.ext), []).append(entry)
+    return index
+
+# This function returns the transmitter sets and the receiver sets (both sorted) of the indexed files of the given metrics
+def discover_sets(index, metrics, ext='p2m'):
+    keys = [key for key in index if key[0] in metrics and key[3] == ext]
+    return sorted({tx for _, tx, _, _ in keys}), sorted({rx for _, _, rx, _ in keys})
+
+# This function orders sets (e.g. receiver sets) with the preferred ones first, in the preferred order, followed by the others
+def order_sets(sets, preferred):
+    return [name for name in preferred if name in sets] + [name for name in sets if name not in preferred]
+
+# This function returns the sequence of a metric for one transmitter set over the receiver sets, e.g. ['.doa.t001_02.r010', '.doa.t001_02.r009']
+def build_sequence(metric, tx, rx_sets):
+    return [f'.{metric}.{tx}.{rx}' for rx in rx_sets]
+
+# This function returns the names of the indexed files of a sequence with the given extension, in the order of the sequence
+def lookup_files(index, sequence, ext='p2m'):
+    files = []
+    for entry in sequence:
+        metric, tx, rx = parse_sequence_entry(entry)
+        files.extend(file_entry.file for file_entry in index.get((metric, tx, rx, ext), []))
+    return files
+
+# This function reports the sequence entries that have no file (missing) or more than one file (duplicates) in the index
+def validate_file_index(index, sequences, ext='p2m'):
+    missing = []
+    duplicates = []
+    for sequence in sequences:
+        for entry in sequence:
+            metric, tx, rx = parse_sequence_entry(entry)
+            file_entries = index.get((metric, tx, rx, ext), [])
+            if not file_entries:
+                missing.append(f'{entry}.{ext}')
+            elif len(file_entries) > 1:
+                duplicates.append(', '.join(file_entry.file for file_entry in file_entries))
+    return missing, duplicates
+
+# This function stops the run up front if any sequence entry is missing or duplicated in the index
+def check_file_index(index, sequences, ext='p2m'):
+    missing, duplicates = validate_file_index(index, sequences, ext)
+    if missing or duplicates:
+        report = [f'Missing file: *{entry}' for entry in missing] + [f'Duplicate files: {files}' for files in duplicates]
+        raise ValueError('Wireless InSite output folder is incomplete:\n' + '\n'.join(report))
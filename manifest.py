@@ -0,0 +1,75 @@
+import hashlib
+import json
+import os
+
+# Name of the manifest file in the merged_data folder
+MANIFEST_FILE = 'manifest.json'
+MANIFEST_VERSION = 1
+
+# SHA-256 of the files hashed in this process, keyed by (path, size, mtime_ns), so inputs shared by several outputs are read only once
+_hashes = {}
+
+# This function returns an empty manifest
+def new_manifest():
+    return {'version': MANIFEST_VERSION, 'outputs': {}}
+
+# This function returns the signature of a file: size and modification time, plus the SHA-256 of the content when use_hash is True
+def file_signature(file_path, use_hash=False):
+    stat = os.stat(file_path)
+    signature = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    if use_hash:
+        key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+        if key not in _hashes:
+            sha256 = hashlib.sha256()
+            with open(file_path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    sha256.update(block)
+            _hashes[key] = sha256.hexdigest()
+        signature['sha256'] = _hashes[key]
+    return signature
+
+# This function checks if a file still matches a recorded signature (with use_hash, a file that was only touched still matches)
+def signature_matches(file_path, recorded, use_hash=False):
+    if recorded is None or not os.path.exists(file_path):
+        return False
+    current = file_signature(file_path)
+    if current['size'] == recorded.get('size') and current['mtime_ns'] == recorded.get('mtime_ns'):
+        return True
+    return use_hash and current['size'] == recorded.get('size') and 'sha256' in recorded and file_signature(file_path, True)['sha256'] == recorded['sha256']
+
+# This function loads the manifest of a merged_data folder (an empty manifest if there is none or it cannot be read)
+def load_manifest(merged_data_file_path):
+    try:
+        with open(os.path.join(merged_data_file_path, MANIFEST_FILE), 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return new_manifest()
+    if manifest.get('version') != MANIFEST_VERSION:
+        return new_manifest()
+    return manifest
+
+# This function saves the manifest into the merged_data folder (written to a temporary file first, so an interrupted run leaves the old manifest intact)
+def save_manifest(merged_data_file_path, manifest):
+    os.makedirs(merged_data_file_path, exist_ok=True)
+    file_path = os.path.join(merged_data_file_path, MANIFEST_FILE)
+    with open(file_path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(file_path + '.tmp', file_path)
+
+# This function checks if an output was built from exactly the given inputs in their current state and with the same options, and was not changed since (paths are relative to root)
+def is_up_to_date(manifest, root, output, inputs, use_hash=False, options=None):
+    entry = manifest['outputs'].get(output)
+    if entry is None or sorted(entry['inputs']) != sorted(inputs) or entry.get('options') != options:
+        return False
+    if not signature_matches(os.path.join(root, output), entry['output'], use_hash):
+        return False
+    return all(signature_matches(os.path.join(root, file), entry['inputs'][file], use_hash) for file in inputs)
+
+# This function records that an output was built from the given inputs, and with the given options if any (paths are relative to root)
+def record_output(manifest, root, output, inputs, use_hash=False, options=None):
+    manifest['outputs'][output] = {
+        'inputs': {file: file_signature(os.path.join(root, file), use_hash) for file in inputs},
+        'output': file_signature(os.path.join(root, output), use_hash),
+    }
+    if options is not None:
+        manifest['outputs'][output]['options'] = options
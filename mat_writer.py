@@ -0,0 +1,70 @@
+import io
+import os
+import shutil
+import struct
+import tempfile
+import numpy as np
+from scipy.io import savemat
+
+# MATLAB (v5) array class and data type of the column dtypes that can be streamed
+MAT_TYPES = {
+    np.dtype('<f8'): (6, 9),
+    np.dtype('<f4'): (7, 7),
+    np.dtype('i1'): (8, 1),
+    np.dtype('u1'): (9, 2),
+    np.dtype('<i4'): (12, 5),
+    np.dtype('<u4'): (13, 6),
+    np.dtype('<i8'): (14, 12),
+}
+
+# Type of the MATLAB (v5) data element that holds an array
+MI_MATRIX = 14
+
+# This function returns the header of a MATLAB (v5) column vector variable with count values of the given dtype
+def _column_header(name, dtype, count):
+    mx_class, mi_type = MAT_TYPES[dtype]
+    name = name.encode('ascii')
+    name_padding = -len(name) % 8
+    data_size = count * dtype.itemsize
+    size = 16 + 16 + 8 + len(name) + name_padding + 8 + data_size + (-data_size % 8)
+    if size >= 1 << 32:
+        raise ValueError(f'{name.decode()}: {count} values do not fit in a MATLAB v5 variable')
+    return (struct.pack('<II', MI_MATRIX, size)
+            + struct.pack('<IIII', 6, 8, mx_class, 0)
+            + struct.pack('<IIii', 5, 8, count, 1)
+            + struct.pack('<II', 1, len(name)) + name + b'\0' * name_padding
+            + struct.pack('<II', mi_type, data_size))
+
+# This function writes a MATLAB (v5) file from chunks of column vectors (dicts of variable name -> 1-D array), so the columns never have to be in memory as a whole
+# The chunks are spooled to temporary files next to the output and copied into the file at the end; variables holds small extra variables written with savemat
+def write_mat_columns(mat_file_path, chunks, variables=None):
+    folder = os.path.dirname(os.path.abspath(mat_file_path))
+    with tempfile.TemporaryDirectory(dir=folder) as spool_folder:
+        spools = {}
+        try:
+            for chunk in chunks:
+                for name, values in chunk.items():
+                    values = np.asarray(values)
+                    if name not in spools:
+                        dtype = values.dtype.newbyteorder('<') if values.dtype.byteorder == '>' else values.dtype
+                        if dtype not in MAT_TYPES:
+                            raise ValueError(f'{name}: cannot write {values.dtype} columns')
+                        spools[name] = [open(os.path.join(spool_folder, f'{len(spools)}.bin'), 'w+b'), dtype, 0]
+                    spool = spools[name]
+                    values.astype(spool[1], copy=False).tofile(spool[0])
+                    spool[2] += values.size
+
+            # Header and small variables from savemat, then the spooled columns
+            buffer = io.BytesIO()
+            savemat(buffer, variables or {})
+            with open(mat_file_path + '.tmp', 'wb') as f:
+                f.write(buffer.getvalue())
+                for name, (spool, dtype, count) in spools.items():
+                    f.write(_column_header(name, dtype, count))
+                    spool.seek(0)
+                    shutil.copyfileobj(spool, f, 1 << 20)
+                    f.write(b'\0' * (-count * dtype.itemsize % 8))
+            os.replace(mat_file_path + '.tmp', mat_file_path)
+        finally:
+            for spool in spools.values():
+                spool[0].close()
@@ -0,0 +1,288 @@
+import io
+import os
+from collections import namedtuple
+from functools import lru_cache
+from itertools import chain
+import numpy as np
+
+# Wireless InSite metrics that store one row per receiver point: <point> <X> <Y> <Z> <Distance> <value(s)>
+FLAT_METRICS = ('power', 'pl', 'fspl', 'xpl', 'pg', 'spread', 'txloss', 'fspl0', 'xpl0', 'fspower', 'fspower0', 'dspower')
+
+# Wireless InSite metrics that store a block of paths per receiver point: <point> <number of paths>, then <path number> <value(s)> per path
+NESTED_METRICS = ('doa', 'dod', 'cir', 'toa', 'doppler')
+
+# Parsed nested file in CSR layout: the paths of receiver i are the rows offsets[i]:offsets[i+1] of path and values
+P2MPaths = namedtuple('P2MPaths', ['receiver', 'offsets', 'path', 'values'])
+
+# Interaction types of the .paths interaction descriptions (e.g. 'Tx-R-DS-Rx'), stored as their index in this tuple
+INTERACTION_TYPES = ('Tx', 'Rx', 'R', 'D', 'DS', 'T', 'F', 'X')
+
+# Records of a .paths file: one per receiver point, one per path and one per interaction point of a path (including Tx and Rx)
+# first_point is the index of the first interaction point of the path among all points of the file; the path owns n_interactions + 2 points
+PATHS_RECEIVER_DTYPE = np.dtype([('receiver', '<i4'), ('n_paths', '<i4'), ('power', '<f8'), ('mean_toa', '<f8'), ('delay_spread', '<f8')])
+PATHS_PATH_DTYPE = np.dtype([('receiver', '<i4'), ('path', '<i4'), ('n_interactions', '<i4'), ('power', '<f8'), ('phase', '<f8'), ('toa', '<f8'),
+                             ('arrival_theta', '<f8'), ('arrival_phi', '<f8'), ('departure_theta', '<f8'), ('departure_phi', '<f8'), ('first_point', '<i8')])
+PATHS_POINT_DTYPE = np.dtype([('interaction', 'i1'), ('x', '<f8'), ('y', '<f8'), ('z', '<f8')])
+
+# Chunk of a .paths file: the receivers whose header, the paths whose summary line and the points whose line is in the chunk
+PathsChunk = namedtuple('PathsChunk', ['receivers', 'paths', 'points'])
+
+# Number of values on a path summary line of a .paths file
+PATHS_PATH_COLUMNS = 9
+
+# This function returns the metric of a Wireless InSite output file name (e.g. 'doa' for 'Project.doa.t001_01.r007.p2m')
+def p2m_metric(file_name):
+    parts = os.path.basename(file_name).rsplit('.', 4)
+    return parts[1] if len(parts) == 5 else None
+
+# This function reads a file in bulk and returns the bytes after the header comment lines (lines starting with '#')
+def _read_body(file_path):
+    with open(file_path, 'rb') as f:
+        data = f.read()
+
+    start = 0
+    while data.startswith(b'#', start):
+        end = data.find(b'\n', start)
+        if end == -1:
+            return b''
+        start = end + 1
+    return data[start:]
+
+# This function splits a byte buffer into lines and returns the start of every line, the position of every token and the number of tokens per line
+# Tokens are separated by any byte up to 32 (space, tab, CR, LF and the other ASCII control characters)
+def _split_lines(buf):
+    is_space = buf <= 32
+    token_start = ~is_space
+    token_start[1:] &= is_space[:-1]
+
+    line_start = np.concatenate(([0], np.flatnonzero(buf[:-1] == 10) + 1))
+    token_pos = np.flatnonzero(token_start)
+    return line_start, token_pos, np.diff(np.searchsorted(token_pos, np.append(line_start, buf.size)))
+
+# This function parses the numbers of a byte buffer straight from the bytes, one np.loadtxt pass per number of tokens per line
+# Returns a dict mapping each number of tokens to the values of its lines (one row per line, in the order of the buffer); the group of lines that fills most of the buffer
+# is parsed in place with the other lines commented out, the smaller groups are gathered into a buffer of their own first
+def _parse_line_groups(buf, line_start, counts, file_path):
+    line_length = np.diff(np.append(line_start, buf.size))
+    groups = {}
+    for n_tokens in np.unique(counts[counts > 0]).tolist():
+        in_group = counts == n_tokens
+        others = ~in_group & (counts > 0)
+        if not np.any(others):
+            text = buf
+        elif 2 * int(line_length[in_group].sum()) > buf.size:
+            text = buf.copy()
+            text[line_start[others]] = ord('#')
+        else:
+            starts, lengths = line_start[in_group], line_length[in_group]
+            ends = np.cumsum(lengths)
+            text = buf[np.arange(ends[-1]) + np.repeat(starts - (ends - lengths), lengths)]
+        try:
+            values = np.loadtxt(io.BytesIO(text.tobytes()), dtype=np.float64, ndmin=2)
+        except ValueError as error:
+            raise ValueError(f'{file_path}: {error}') from None
+        if values.shape != (np.count_nonzero(in_group), n_tokens):
+            raise ValueError(f'{file_path}: expected {np.count_nonzero(in_group)} lines of {n_tokens} numbers but parsed {values.shape[0]}')
+        groups[n_tokens] = values
+    return groups
+
+# This function parses the numbers of a byte buffer into one float64 array, in the order of the buffer
+def _parse_numbers(buf, line_start, counts, file_path):
+    numbers = np.empty(int(counts.sum()), dtype=np.float64)
+    first_number = np.concatenate(([0], np.cumsum(counts[:-1])))
+    for n_tokens, values in _parse_line_groups(buf, line_start, counts, file_path).items():
+        numbers[first_number[counts == n_tokens][:, None] + np.arange(n_tokens)] = values
+    return numbers
+
+# This function reads a file after its header comment lines and returns its bytes, the start of every line and the number of tokens per line
+def _read_lines(file_path):
+    buf = np.frombuffer(_read_body(file_path), dtype=np.uint8)
+    if buf.size == 0:
+        return buf, np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    line_start, _, counts = _split_lines(buf)
+    return buf, line_start, counts
+
+# This function reads a flat per-receiver file (power, pl, fspl, xpl, pg, spread, txloss, ...) into a float64 array with one row per receiver point
+def read_p2m_table(file_path):
+    buf, line_start, counts = _read_lines(file_path)
+    n_cols = np.unique(counts[counts > 0])
+    if n_cols.size == 0:
+        return np.zeros((0, 0), dtype=np.float64)
+    if n_cols.size > 1:
+        raise ValueError(f'{file_path}: rows do not all have {counts[counts > 0][0]} columns')
+    return _parse_line_groups(buf, line_start, counts, file_path)[int(n_cols[0])]
+
+# This function counts the rows (receiver points) of a flat file without parsing the values
+def count_p2m_rows(file_path):
+    return int(np.count_nonzero(_read_lines(file_path)[2]))
+
+# This function reads a nested receiver -> path file (doa, dod, cir, toa, doppler) into CSR offsets plus typed value arrays
+def read_p2m_paths(file_path):
+    buf, line_start, counts = _read_lines(file_path)
+    lines = np.flatnonzero(counts)
+    if lines.size == 0 or counts[lines[0]] != 1:
+        raise ValueError(f'{file_path}: missing number of receiver points')
+
+    # The first line holds the number of receiver points, lines with two tokens are receiver headers (<point> <number of paths>), longer lines are paths
+    path_counts = np.unique(counts[counts > 2])
+    if path_counts.size > 1:
+        raise ValueError(f'{file_path}: path rows do not all have {counts[counts > 2][0]} columns')
+    if np.count_nonzero(counts == 1) > 1:
+        raise ValueError(f'{file_path}: unexpected line with a single number after the number of receiver points')
+    groups = _parse_line_groups(buf, line_start, counts, file_path)
+    headers = groups.get(2, np.zeros((0, 2)))
+    rows = groups[int(path_counts[0])] if path_counts.size else np.zeros((0, 1))
+
+    receiver = headers[:, 0].astype(np.int32)
+    n_paths = headers[:, 1].astype(np.int64)
+    offsets = np.concatenate(([0], np.cumsum(n_paths)))
+    if receiver.size != int(groups[1][0, 0]):
+        raise ValueError(f'{file_path}: header announces {int(groups[1][0, 0])} receiver points but {receiver.size} were found')
+
+    if offsets[-1] != rows.shape[0]:
+        raise ValueError(f'{file_path}: receiver headers announce {offsets[-1]} paths but {rows.shape[0]} were found')
+
+    # The paths of every receiver follow its header line
+    paths_before = np.cumsum(counts > 2)[counts == 2]
+    if np.any(paths_before != offsets[:-1]):
+        raise ValueError(f'{file_path}: a receiver header announces a different number of paths than follow it')
+    return P2MPaths(receiver, offsets, rows[:, 0].astype(np.int32), np.ascontiguousarray(rows[:, 1:]))
+
+# This function reads any Wireless InSite .p2m file, choosing the layout from the metric in its name
+def read_p2m(file_path):
+    if p2m_metric(file_path) in NESTED_METRICS:
+        return read_p2m_paths(file_path)
+    return read_p2m_table(file_path)
+
+# This function returns the interaction type codes of a .paths interaction description such as b'Tx-R-Rx' (cached, as few distinct descriptions repeat over millions of paths)
+@lru_cache(maxsize=4096)
+def _interaction_codes(description):
+    try:
+        return tuple(INTERACTION_TYPES.index(name) for name in description.decode('ascii').strip().split('-'))
+    except ValueError:
+        raise ValueError(f'unknown interaction type in {description.strip()!r} (known types: {", ".join(INTERACTION_TYPES)})') from None
+
+# This function parses the complete lines of a block of a .paths file into a PathsChunk
+# Unless final is True, the last receiver or path record is left out, as it may continue in the next block; returns (chunk, number of bytes consumed), or (None, 0) if the block holds no complete record
+def _parse_paths_block(block, final, state, file_path):
+    end = len(block) if final else block.rfind(b'\n') + 1
+    buf = np.frombuffer(block, dtype=np.uint8, count=end)
+    if buf.size == 0:
+        return None, 0
+    line_start, token_pos, counts = _split_lines(buf)
+    line_end = np.append(line_start[1:], buf.size)
+    keep = counts > 0
+    line_start, line_end, counts = line_start[keep], line_end[keep], counts[keep]
+    first_byte = buf[token_pos[np.concatenate(([0], np.cumsum(counts[:-1])))]] | 32
+
+    # Receiver headers have two values, path summaries nine, interaction descriptions are one word, everything else are three values
+    is_description = (counts == 1) & (first_byte >= 97) & (first_byte <= 122)
+    is_header = counts == 2
+    is_path = counts == PATHS_PATH_COLUMNS
+    if not final:
+        starts = np.flatnonzero(is_header | is_path)
+        if starts.size == 0 or starts[-1] == 0:
+            return None, 0
+        cut = starts[-1]
+        end = int(line_start[cut])
+        line_start, line_end, counts = line_start[:cut], line_end[:cut], counts[:cut]
+        is_description, is_header, is_path = is_description[:cut], is_header[:cut], is_path[:cut]
+    is_summary = np.zeros(counts.size, dtype=bool)
+    is_summary[1:] = is_header[:-1] & (counts[1:] == 3)
+    is_point = (counts == 3) & ~is_summary
+    if np.any(~(is_description | is_header | is_path | is_summary | is_point)):
+        raise ValueError(f'{file_path}: unexpected line in .paths file')
+
+    # Blank out the interaction descriptions and parse all numbers of the block at once
+    text = buf[:end].copy()
+    blank = np.zeros(end + 1, dtype=np.int8)
+    np.add.at(blank, line_start[is_description], 1)
+    np.add.at(blank, line_end[is_description], -1)
+    text[np.cumsum(blank[:-1], dtype=np.int8) > 0] = 32
+    counts = np.where(is_description, 0, counts)
+    first_number = np.concatenate(([0], np.cumsum(counts[:-1])))
+    numbers = _parse_numbers(text, line_start, counts, file_path)
+
+    # Receiver summaries (NaN if a receiver without paths has no summary line)
+    header_line = np.flatnonzero(is_header)
+    receivers = np.zeros(header_line.size, dtype=PATHS_RECEIVER_DTYPE)
+    receivers['receiver'] = numbers[first_number[header_line]]
+    receivers['n_paths'] = numbers[first_number[header_line] + 1]
+    summary = numbers[first_number[np.minimum(header_line + 1, counts.size - 1)][:, None] + np.arange(3)] if header_line.size else np.zeros((0, 3))
+    has_summary = is_summary[np.minimum(header_line + 1, counts.size - 1)]
+    for column, name in enumerate(['power', 'mean_toa', 'delay_spread']):
+        receivers[name] = np.where(has_summary, summary[:, column], np.nan)
+
+    # Path summaries; the paths before the first header of the block belong to the last receiver of the previous block
+    path_line = np.flatnonzero(is_path)
+    values = numbers[first_number[path_line][:, None] + np.arange(PATHS_PATH_COLUMNS)]
+    header_count = np.cumsum(is_header)[path_line]
+    paths = np.zeros(path_line.size, dtype=PATHS_PATH_DTYPE)
+    paths['receiver'] = np.where(header_count > 0, receivers['receiver'][np.maximum(header_count - 1, 0)] if receivers.size else 0, state['receiver'])
+    paths['path'] = values[:, 0]
+    paths['n_interactions'] = values[:, 1]
+    for column, name in enumerate(['power', 'phase', 'toa', 'arrival_theta', 'arrival_phi', 'departure_theta', 'departure_phi'], start=2):
+        paths[name] = values[:, column]
+
+    # Check the number of paths of every receiver, carrying the count of the last receiver over to the next block
+    segment_paths = np.bincount(header_count, minlength=header_line.size + 1)
+    remaining = state['remaining'] - segment_paths[0]
+    if header_line.size:
+        if remaining != 0 or np.any(segment_paths[1:-1] != receivers['n_paths'][:-1]):
+            raise ValueError(f'{file_path}: a receiver header announces a different number of paths than were found')
+        remaining = int(receivers['n_paths'][-1] - segment_paths[-1])
+        state['receiver'] = int(receivers['receiver'][-1])
+    if remaining < 0:
+        raise ValueError(f'{file_path}: a receiver header announces a different number of paths than were found')
+    state['remaining'] = remaining
+
+    # Interaction points: every path is followed by one description and n_interactions + 2 points
+    point_line = np.flatnonzero(is_point)
+    points = np.zeros(point_line.size, dtype=PATHS_POINT_DTYPE)
+    coordinates = numbers[first_number[point_line][:, None] + np.arange(3)]
+    points['x'], points['y'], points['z'] = coordinates[:, 0], coordinates[:, 1], coordinates[:, 2]
+    points_before = np.cumsum(is_point)[path_line]
+    n_points = np.diff(np.append(points_before, point_line.size))
+    descriptions_before = np.cumsum(is_description)[path_line]
+    n_descriptions = np.diff(np.append(descriptions_before, np.count_nonzero(is_description)))
+    if (path_line.size and points_before[0] != 0) or np.any(n_points != paths['n_interactions'] + 2) or np.any(n_descriptions != 1):
+        raise ValueError(f'{file_path}: a path does not have one interaction description and n_interactions + 2 points')
+    codes = [_interaction_codes(block[start:stop]) for start, stop in zip(line_start[is_description], line_end[is_description])]
+    if np.any(np.fromiter(map(len, codes), dtype=np.int64, count=len(codes)) != n_points):
+        raise ValueError(f'{file_path}: an interaction description does not match the number of points of its path')
+    points['interaction'] = np.fromiter(chain.from_iterable(codes), dtype=np.int8, count=point_line.size)
+    paths['first_point'] = state['points'] + points_before
+    state['points'] += point_line.size
+    state['receivers'] += receivers.size
+    state['paths'] += paths.size
+
+    return PathsChunk(receivers, paths, points), end
+
+# This function streams a .paths file and yields PathsChunk records of about chunk_bytes of the file at a time, so the memory use does not grow with the file size
+def iter_paths_chunks(file_path, chunk_bytes=1 << 22):
+    state = {'receiver': 0, 'remaining': 0, 'points': 0, 'receivers': 0, 'paths': 0}
+    with open(file_path, 'rb') as f:
+        # Skip the header comment lines and read the number of receiver points
+        line = f.readline()
+        while line.startswith(b'#'):
+            line = f.readline()
+        try:
+            n_receivers = int(line)
+        except ValueError:
+            raise ValueError(f'{file_path}: missing number of receiver points') from None
+
+        rest = b''
+        while True:
+            data = f.read(chunk_bytes)
+            block = rest + data
+            chunk, end = _parse_paths_block(block, not data, state, file_path)
+            rest = block[end:]
+            if chunk is not None:
+                yield chunk
+            if not data:
+                break
+
+    if state['receivers'] != n_receivers:
+        raise ValueError(f'{file_path}: header announces {n_receivers} receiver points but {state["receivers"]} were found')
+    if state['remaining'] != 0:
+        raise ValueError(f'{file_path}: a receiver header announces a different number of paths than were found')
@@ -0,0 +1,153 @@
+import cProfile
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# resource is not available on Windows, where the peak RSS is not reported
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Name of the profile report, written to merged_data, and version of its layout
+PROFILE_FILE = 'profile_report.json'
+PROFILE_VERSION = 1
+
+# Number of allocation sites listed per stage when memory allocations are traced, and the files whose own allocations are left out
+TRACEMALLOC_TOP = 10
+TRACEMALLOC_IGNORED = [tracemalloc.Filter(False, __file__), tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, cProfile.__file__), tracemalloc.Filter(False, '<frozen *>')]
+
+# This function returns a new, empty profile report; with cprofile_folder every stage also runs under cProfile (one .prof file per stage), with trace_memory the Python allocations are traced
+def new_profile(cprofile_folder=None, trace_memory=False):
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    return {
+        'version': PROFILE_VERSION,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': sys.platform,
+        'cprofile_folder': cprofile_folder,
+        'trace_memory': trace_memory,
+        'stages': [],
+    }
+
+# This function returns the peak resident set size (bytes) of the process, or None where it is not available
+def peak_rss():
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+# This function resets the peak resident set size so that it covers the next stage only (Linux only); returns False if it stays the peak of the whole process
+def reset_peak_rss():
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+# This function returns the bytes read and written by the process through system calls (Linux only), or None
+def process_io():
+    try:
+        with open('/proc/self/io', 'r') as f:
+            counters = dict(line.split(':') for line in f if ':' in line)
+        return int(counters['rchar']), int(counters['wchar'])
+    except (OSError, KeyError, ValueError):
+        return None
+
+# This function returns the size of a file, or of all files below a folder
+def path_size(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, file)) for root, _, files in os.walk(path) for file in files)
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+# This function adds files (or folders, counted with all their files) read and written by a stage to its file and byte counts
+def count_files(stage, read=(), written=()):
+    for path in read:
+        stage['files_read'] += 1
+        stage['bytes_read'] += path_size(path)
+    for path in written:
+        stage['files_written'] += 1
+        stage['bytes_written'] += path_size(path)
+
+# This function measures a stage of the pipeline: wall and CPU time, peak RSS, and optionally the cProfile statistics and the traced Python allocations
+# The stage record is yielded so the caller can add file counts (count_files), rows and other details; without a profile (None) nothing is measured
+@contextmanager
+def profile_stage(profile, name, **details):
+    stage = {'name': name, **details, 'files_read': 0, 'bytes_read': 0, 'files_written': 0, 'bytes_written': 0, 'rows': None}
+    if profile is None:
+        yield stage
+        return
+
+    rss_scope = 'stage' if reset_peak_rss() else 'process'
+    io_start = process_io()
+    if profile['trace_memory']:
+        snapshot_start = tracemalloc.take_snapshot().filter_traces(TRACEMALLOC_IGNORED)
+        tracemalloc.reset_peak()
+        traced_start = tracemalloc.get_traced_memory()[0]
+    profiler = cProfile.Profile() if profile['cprofile_folder'] else None
+    times_start = os.times()
+    wall_start = time.perf_counter()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield stage
+    except BaseException:
+        stage['failed'] = True
+        raise
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        wall = time.perf_counter() - wall_start
+        times_end = os.times()
+        stage['wall_s'] = wall
+        stage['cpu_s'] = (times_end.user - times_start.user) + (times_end.system - times_start.system)
+        # CPU time of worker processes is only counted once they have exited
+        stage['children_cpu_s'] = (times_end.children_user - times_start.children_user) + (times_end.children_system - times_start.children_system)
+        stage['peak_rss_bytes'] = peak_rss()
+        stage['peak_rss_scope'] = rss_scope
+        io_end = process_io()
+        if io_start is not None and io_end is not None:
+            stage['io_read_bytes'] = io_end[0] - io_start[0]
+            stage['io_write_bytes'] = io_end[1] - io_start[1]
+        if profile['trace_memory']:
+            current, peak = tracemalloc.get_traced_memory()
+            stage['traced_peak_bytes'] = peak - traced_start
+            stage['traced_retained_bytes'] = current - traced_start
+            # Allocation sites whose retained memory grew the most during the stage
+            statistics = tracemalloc.take_snapshot().filter_traces(TRACEMALLOC_IGNORED).compare_to(snapshot_start, 'lineno')
+            stage['traced_top'] = [{'site': f'{stat.traceback[0].filename}:{stat.traceback[0].lineno}', 'bytes': stat.size_diff, 'count': stat.count_diff} for stat in statistics[:TRACEMALLOC_TOP] if stat.size_diff > 0]
+        if profiler is not None:
+            os.makedirs(profile['cprofile_folder'], exist_ok=True)
+            prof_file = os.path.join(profile['cprofile_folder'], ''.join(c if c.isalnum() or c in '-_' else '_' for c in name) + '.prof')
+            profiler.dump_stats(prof_file)
+            stage['cprofile_file'] = prof_file
+        profile['stages'].append(stage)
+
+# This function saves a profile report as JSON, replacing the previous report atomically
+def save_profile(profile, file_path):
+    with open(file_path + '.tmp', 'w') as f:
+        json.dump(profile, f, indent=2)
+    os.replace(file_path + '.tmp', file_path)
+
+# This function prints a summary table of the stages of a profile report
+def print_profile(profile):
+    print(f'{"stage":<44} {"wall (s)":>9} {"cpu (s)":>9} {"peak RSS (MB)":>14} {"read (MB)":>10} {"written (MB)":>13} {"files":>6} {"rows":>9}')
+    for stage in profile['stages']:
+        rss = '' if stage['peak_rss_bytes'] is None else f'{stage["peak_rss_bytes"] / 1e6:.1f}'
+        rows = '' if stage['rows'] is None else stage['rows']
+        cpu = stage['cpu_s'] + stage['children_cpu_s']
+        print(f'{stage["name"]:<44} {stage["wall_s"]:>9.3f} {cpu:>9.3f} {rss:>14} {stage["bytes_read"] / 1e6:>10.2f} {stage["bytes_written"] / 1e6:>13.2f} {stage["files_read"]:>6} {rows:>9}')
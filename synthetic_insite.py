@@ -0,0 +1,199 @@
+import argparse
+import os
+import numpy as np
+import pandas as pd
+from file_index import order_sets
+from emulate_code_insite import RX_SET_ORDER
+
+# Metrics written by the generator: flat files (one row per receiver point) and nested files (one block of paths per receiver point)
+SYNTHETIC_FLAT_METRICS = ('power', 'fspl', 'pl', 'xpl')
+SYNTHETIC_NESTED_METRICS = ('doa', 'dod', 'cir', 'toa', 'doppler')
+
+# Column headers of the generated files, as written by Wireless InSite (the DOD header names the arrival angles, like the sample files)
+FLAT_HEADERS = {
+    'power': '# <X(m)> <Y(m)> <Z(m)> <Distance(m)> <Power(dBm)> <Phase(deg)>',
+    'fspl': '# <X(m)> <Y(m)> <Z(m)> <Distance(m)> <FreeSpacePathLoss(dB)>',
+    'pl': '# <X(m)> <Y(m)> <Z(m)> <Distance(m)> <PathLoss(dB)>',
+    'xpl': '# <X(m)> <Y(m)> <Z(m)> <Distance(m)> <ExcessPathLoss(dB)>',
+}
+NESTED_HEADERS = {
+    'doa': '# <path number> <arrival phi(deg)> <arrival theta(deg)> <received power(dBm)>',
+    'dod': '# <path number> <arrival phi(deg)> <arrival theta(deg)> <received power(dBm)>',
+    'cir': '# <path number> <phase value(deg)> <mean time of arrival(sec)> <received power(dBm)>',
+    'toa': '# <path number> <time of arrival(sec)> <received power(dBm)> ',
+    'doppler': '# <path number> <doppler shift (Hz)> << received power(dBm)> ',
+}
+
+# Carrier frequency (Hz) and speed of light (m/s) used for the free-space path loss and the delays
+CARRIER_FREQUENCY = 60e9
+SPEED_OF_LIGHT = 299792458.0
+
+# Shape of the sample folder (2 transmitter sets, 4 receiver sets, 78 receiver points, 25 paths per point), the 1x scale of the benchmarks
+SAMPLE_TX_SETS = 2
+SAMPLE_RX_SETS = 4
+SAMPLE_RECEIVERS = 78
+SAMPLE_PATHS = 25
+
+# This function returns the file name of a generated file
+def synthetic_file_name(project, metric, tx, rx):
+    return f'{project}.{metric}.{tx}.{rx}.p2m'
+
+# This function formats the rows of a table with one format per column (like Wireless InSite, 6 significant digits) and returns one line per row
+def format_rows(fmt, *columns):
+    return [fmt % row for row in zip(*(column.tolist() for column in columns))]
+
+# This function writes a flat file: 3 header lines and one row per receiver point
+def write_flat_file(file_path, tx_header, rx_header, metric, points, values):
+    lines = [tx_header, rx_header, FLAT_HEADERS[metric]]
+    lines += format_rows('%d %g %g %g %g' + ' %g' * values.shape[1], points['point'], points['x'], points['y'], points['z'], points['distance'], *values.T)
+    with open(file_path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+# This function writes a nested file: 5 header lines, the number of receiver points, and per point a row <point> <number of paths> followed by one row per path
+def write_nested_file(file_path, tx_header, rx_header, metric, points, offsets, values):
+    n_paths = np.diff(offsets)
+    path = np.arange(offsets[-1]) - np.repeat(offsets[:-1], n_paths) + 1
+    trailing = ' ' if metric in ('toa', 'doppler') else ''
+    path_lines = format_rows('%d' + ' %g' * values.shape[1] + trailing, path, *values.T)
+    lines = [tx_header, rx_header + ' ', '# <number of receiver points>', '# <receiver point number> <number of paths for this point>', NESTED_HEADERS[metric], f' {len(points["point"])}']
+    for point, start, end in zip(points['point'].tolist(), offsets[:-1].tolist(), offsets[1:].tolist()):
+        lines.append(f'{point} {end - start}')
+        lines.extend(path_lines[start:end])
+    with open(file_path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+# This function writes a synthetic Wireless InSite output folder (.p2m files in the formats of the sample folder) and its receiver position table
+# n_points is the number of receiver points of every receiver set (or a list with one count per set); every point has between min_paths and n_paths paths (the same for all transmitters)
+# metrics limits the written files to some of SYNTHETIC_FLAT_METRICS and SYNTHETIC_NESTED_METRICS (all by default)
+# The position table (laid out like RXMatPositions350.xlsx, receivers on random cells of a grid_size x grid_size grid, in the receiver set order of main()) is written to rx_positions_file, by default next to the folder
+# Returns a summary with the transmitter and receiver sets, the number of receiver points, paths, files and bytes, and the position table
+def write_synthetic_insite(folder_path, n_tx=SAMPLE_TX_SETS, n_rx_sets=SAMPLE_RX_SETS, n_points=SAMPLE_RECEIVERS // SAMPLE_RX_SETS, n_paths=SAMPLE_PATHS, min_paths=None,
+                           grid_size=350, project='Synthetic', rx_positions_file=None, rx_set_order=RX_SET_ORDER, metrics=None, seed=0):
+    rng = np.random.default_rng(seed)
+    if metrics is None:
+        metrics = SYNTHETIC_FLAT_METRICS + SYNTHETIC_NESTED_METRICS
+    os.makedirs(folder_path, exist_ok=True)
+    if rx_positions_file is None:
+        rx_positions_file = os.path.abspath(folder_path) + '_RXMatPositions.xlsx'
+    min_paths = n_paths if min_paths is None else min_paths
+    point_counts = list(n_points) if np.iterable(n_points) else [n_points] * n_rx_sets
+    tx_sets = [f't{tx:03d}_01' for tx in range(1, n_tx + 1)]
+    rx_sets = [f'r{rx:03d}' for rx in range(1, len(point_counts) + 1)]
+    n_receivers = sum(point_counts)
+    if n_receivers > (grid_size - 1) ** 2:
+        raise ValueError(f'{n_receivers} receivers do not fit on a {grid_size}x{grid_size} grid')
+
+    # Receiver points of every set: a walk of 6 m steps, and the number of paths of every point
+    transmitters = rng.uniform(-50, 50, (n_tx, 3)) * [1, 1, 0] + [0, 0, 10]
+    sets = {}
+    for rx, count in zip(rx_sets, point_counts):
+        steps = rng.normal(0, 1, (count, 2))
+        steps = 6 * steps / np.linalg.norm(steps, axis=1, keepdims=True)
+        xy = rng.uniform(-100, 100, 2) + np.cumsum(steps, axis=0) - steps[0]
+        points = {'point': np.arange(1, count + 1), 'x': xy[:, 0], 'y': xy[:, 1], 'z': np.full(count, 1.6), 'distance': 6.0 * np.arange(count)}
+        sets[rx] = (points, np.concatenate(([0], np.cumsum(rng.integers(min_paths, n_paths + 1, count)))))
+
+    files = 0
+    n_bytes = 0
+    for tx_number, (tx, position) in enumerate(zip(tx_sets, transmitters), start=1):
+        tx_header = f'# <Transmitter Set: Tx: {tx_number} TX{tx_number} - Point 1> '
+        for rx_number, rx in enumerate(rx_sets, start=1):
+            points, offsets = sets[rx]
+            rx_header = f'# <Receiver Set: Rx: {rx_number} Walk{rx_number}>'
+            count = len(points['point'])
+            total = int(offsets[-1])
+
+            # Paths: the line-of-sight delay plus an exponential excess delay, with a power decaying with the excess delay
+            distance = np.hypot(np.hypot(points['x'] - position[0], points['y'] - position[1]), points['z'] - position[2])
+            receiver = np.repeat(np.arange(count), np.diff(offsets))
+            excess = rng.exponential(30e-9, total)
+            excess[offsets[:-1][np.diff(offsets) > 0]] = 0
+            delay = distance[receiver] / SPEED_OF_LIGHT + excess
+            fspl = 20 * np.log10(distance) + 20 * np.log10(CARRIER_FREQUENCY) - 147.55
+            power = 10 - fspl[receiver] - excess / 10e-9 * rng.uniform(1, 4, total)
+            phase = rng.uniform(-180, 180, total)
+            nested = {
+                'doa': np.column_stack((rng.uniform(-180, 180, total), rng.uniform(60, 120, total), power)),
+                'dod': np.column_stack((rng.uniform(-180, 180, total), rng.uniform(60, 120, total), power)),
+                'cir': np.column_stack((phase, delay, power)),
+                'toa': np.column_stack((delay, power)),
+                'doppler': np.column_stack((np.zeros(total), power)),
+            }
+
+            # Received power and phase of every point from the coherent sum of its paths, and the losses
+            field = np.add.reduceat(np.append(10 ** (power / 20) * np.exp(1j * np.deg2rad(phase)), 0), np.minimum(offsets[:-1], total))
+            field[np.diff(offsets) == 0] = 0
+            with np.errstate(divide='ignore'):
+                received = 20 * np.log10(np.abs(field))
+            pl = 10 - received
+            flat = {
+                'power': np.column_stack((received, np.rad2deg(np.angle(field)))),
+                'fspl': fspl[:, None],
+                'pl': pl[:, None],
+                'xpl': (pl - fspl)[:, None],
+            }
+
+            for metric, values in flat.items():
+                if metric not in metrics:
+                    continue
+                file_path = os.path.join(folder_path, synthetic_file_name(project, metric, tx, rx))
+                write_flat_file(file_path, tx_header, rx_header, metric, points, values)
+                files += 1
+                n_bytes += os.path.getsize(file_path)
+            for metric, values in nested.items():
+                if metric not in metrics:
+                    continue
+                file_path = os.path.join(folder_path, synthetic_file_name(project, metric, tx, rx))
+                write_nested_file(file_path, tx_header, rx_header, metric, points, offsets, values)
+                files += 1
+                n_bytes += os.path.getsize(file_path)
+
+    # Position table in the order of the merged tables: rows from/rows end are the (0-based, as build_rx_scatter_index reads them) DataTX rows of the rays of a receiver,
+    # which follow its <point> <number of paths> row
+    ordered = order_sets(rx_sets, rx_set_order)
+    n_rays = np.concatenate([np.diff(sets[rx][1]) for rx in ordered])
+    block_start = np.concatenate(([0], np.cumsum(1 + n_rays)[:-1]))
+    cells = rng.choice((grid_size - 1) ** 2, n_receivers, replace=False)
+    positions = pd.DataFrame({
+        'ReceiverID': [f'{rx}-{point}' for rx in ordered for point in sets[rx][0]['point'].tolist()],
+        'Mat_row': cells // (grid_size - 1) + 1,
+        'Mat_col': cells % (grid_size - 1) + 1,
+        'rows from': block_start + 1,
+        'rows end': block_start + n_rays,
+        'positionloss': np.arange(1, n_receivers + 1),
+    })
+    positions.to_excel(rx_positions_file, index=False, header=False)
+
+    return {
+        'folder': folder_path,
+        'rx_positions_file': rx_positions_file,
+        'tx_sets': tx_sets,
+        'rx_sets': ordered,
+        'receivers': n_receivers,
+        'paths': int(n_rays.sum()) * n_tx,
+        'files': files,
+        'bytes': n_bytes,
+    }
+
+# This function writes a synthetic output folder at a multiple of the size of the sample folder (more receiver points per set)
+def write_scaled_insite(folder_path, scale, n_tx=SAMPLE_TX_SETS, n_rx_sets=SAMPLE_RX_SETS, **kwargs):
+    n_points = max(1, round(SAMPLE_RECEIVERS * scale / n_rx_sets))
+    return write_synthetic_insite(folder_path, n_tx=n_tx, n_rx_sets=n_rx_sets, n_points=n_points, **kwargs)
+
+# This function parses the command line options of the generator
+def parse_args():
+    parser = argparse.ArgumentParser(description='Write a synthetic Wireless InSite output folder in the formats of the sample folder')
+    parser.add_argument('folder', help='output folder (created if needed)')
+    parser.add_argument('--tx', type=int, default=SAMPLE_TX_SETS, help='number of transmitter sets')
+    parser.add_argument('--rx-sets', type=int, default=SAMPLE_RX_SETS, help='number of receiver sets')
+    parser.add_argument('--points', type=int, default=SAMPLE_RECEIVERS // SAMPLE_RX_SETS, help='number of receiver points per receiver set')
+    parser.add_argument('--paths', type=int, default=SAMPLE_PATHS, help='largest number of paths per receiver point')
+    parser.add_argument('--min-paths', type=int, default=None, help='smallest number of paths per receiver point (default: --paths)')
+    parser.add_argument('--grid-size', type=int, default=350, help='size of the receiver position grid')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+    summary = write_synthetic_insite(args.folder, args.tx, args.rx_sets, args.points, args.paths, args.min_paths, args.grid_size, seed=args.seed)
+    print(f'{summary["files"]} files ({summary["bytes"] / 1e6:.1f} MB), {summary["receivers"]} receiver points, {summary["paths"]} paths; positions in {summary["rx_positions_file"]}')
@@ -0,0 +1,133 @@
+import os
+import shutil
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from channel_stats import CHANNEL_STATS_DTYPE, channel_statistics, segment_max, segment_sum
+from emulate_code_insite import merge_channel_statistics, stack_channel_statistics
+from file_index import build_sequence
+from p2m_parser import P2MPaths, read_p2m_table
+
+SAMPLE_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Sample Wireless InSite output files')
+
+# Three receivers: the first with a 10 dBm and a 0 dBm path, the second without paths, the third with a single -10 dBm path
+RECEIVER = np.array([1, 2, 3], dtype=np.int32)
+OFFSETS = np.array([0, 2, 2, 3])
+
+# This function returns the parsed nested file of the three receivers with the given values per path (the power in dBm is added as the last column)
+def paths(*columns):
+    return P2MPaths(RECEIVER, OFFSETS, np.array([1, 2, 1], dtype=np.int32), np.column_stack(columns + ([10.0, 0.0, -10.0],)))
+
+# Nested files of the example: phase (deg) and delay (s) in cir, Doppler shift (Hz) in doppler, azimuth and elevation (deg) in doa and dod
+EXAMPLE = {
+    'cir': paths([0.0, 180.0, 90.0], [1e-6, 2e-6, 5e-7]),
+    'doppler': paths([100.0, -100.0, 30.0]),
+    'doa': paths([0.0, 90.0, 10.0], [90.0, 90.0, 20.0]),
+    'dod': paths([45.0, 45.0, 0.0], [0.0, 180.0, 0.0]),
+}
+
+@pytest.mark.parametrize('offsets, expected', [
+    ([0, 2, 2, 4, 4], [[3, 0, 7, 0], [30, 0, 70, 0]]),
+    ([0, 0, 2, 2, 4], [[0, 3, 0, 7], [0, 30, 0, 70]]),
+    ([0, 1, 2, 3, 4], [[1, 2, 3, 4], [10, 20, 30, 40]]),
+    ([0, 4], [[10], [100]]),
+])
+def test_segment_sum(offsets, expected):
+    values = np.array([[1.0, 2.0, 3.0, 4.0], [10.0, 20.0, 30.0, 40.0]])
+    np.testing.assert_array_equal(segment_sum(values, np.array(offsets)), expected)
+
+def test_segment_sum_without_paths():
+    np.testing.assert_array_equal(segment_sum(np.zeros((2, 0)), np.array([0, 0, 0])), np.zeros((2, 2)))
+
+@pytest.mark.parametrize('offsets, expected', [
+    ([0, 2, 2, 4, 4], [5, -np.inf, 2, -np.inf]),
+    ([0, 0, 2, 2, 4], [-np.inf, 5, -np.inf, 2]),
+    ([0, 1, 2, 3, 4], [1, 5, 2, -3]),
+])
+def test_segment_max(offsets, expected):
+    np.testing.assert_array_equal(segment_max(np.array([1.0, 5.0, 2.0, -3.0]), np.array(offsets)), expected)
+
+def test_channel_statistics_hand_computed():
+    stats = channel_statistics(**EXAMPLE)
+    first, empty, single = stats
+
+    # 10 mW + 1 mW; the fields of the two paths are in antiphase: (sqrt(10) - 1)**2 mW
+    assert first['IncoherentPower_dBm'] == pytest.approx(10 * np.log10(11))
+    assert first['CoherentPower_dBm'] == pytest.approx(10 * np.log10(11 - 2 * np.sqrt(10)))
+    assert first['KFactor_dB'] == pytest.approx(10)
+
+    # Delays 1 us and 2 us weighted 10:1: mean 12/11 us, variance (10 * 1 + 4) / 11 - (12/11)**2 = 10/121 us**2
+    assert first['MeanDelay_s'] == pytest.approx(12e-6 / 11)
+    assert first['DelaySpread_s'] == pytest.approx(np.sqrt(10) / 11 * 1e-6)
+
+    # Doppler shifts +-100 Hz weighted 10:1: mean 900/11 Hz, variance 10000 - (900/11)**2 = 400000/121 Hz**2
+    assert first['DopplerSpread_Hz'] == pytest.approx(np.sqrt(400000) / 11)
+
+    # Arrival azimuths 0 and 90 deg: |10 + 1j| / 11; equal elevations and departure azimuths have no spread; departure elevations 0 and 180 deg: |10 - 1| / 11
+    assert first['AzimuthSpreadArrival_deg'] == pytest.approx(np.rad2deg(np.sqrt(-2 * np.log(np.sqrt(101) / 11))))
+    assert first['ElevationSpreadArrival_deg'] == pytest.approx(0, abs=1e-6)
+    assert first['AzimuthSpreadDeparture_deg'] == pytest.approx(0, abs=1e-6)
+    assert first['ElevationSpreadDeparture_deg'] == pytest.approx(np.rad2deg(np.sqrt(-2 * np.log(9 / 11))))
+
+    # A single path has its own power, no spread and no other path for the K-factor
+    assert single['IncoherentPower_dBm'] == pytest.approx(-10)
+    assert single['CoherentPower_dBm'] == pytest.approx(-10)
+    assert single['MeanDelay_s'] == pytest.approx(5e-7)
+    for name in ('DelaySpread_s', 'DopplerSpread_Hz', 'AzimuthSpreadArrival_deg', 'ElevationSpreadArrival_deg', 'AzimuthSpreadDeparture_deg', 'ElevationSpreadDeparture_deg'):
+        assert single[name] == pytest.approx(0, abs=1e-6), name
+    assert single['KFactor_dB'] == np.inf
+
+    # A receiver without paths has no statistics
+    assert all(np.isnan(empty[name]) for name in CHANNEL_STATS_DTYPE.names)
+
+def test_channel_statistics_missing_files_are_nan():
+    stats = channel_statistics(doa=EXAMPLE['doa'])
+    assert stats[0]['IncoherentPower_dBm'] == pytest.approx(10 * np.log10(11))
+    for name in ('CoherentPower_dBm', 'MeanDelay_s', 'DelaySpread_s', 'DopplerSpread_Hz', 'AzimuthSpreadDeparture_deg'):
+        assert np.isnan(stats[name]).all(), name
+
+def test_channel_statistics_different_path_counts():
+    other = P2MPaths(RECEIVER, np.array([0, 1, 2, 3]), np.ones(3, dtype=np.int32), np.zeros((3, 2)))
+    with pytest.raises(ValueError, match='same receivers'):
+        channel_statistics(cir=EXAMPLE['cir'], doa=other)
+
+def test_stack_channel_statistics_sized_from_flat_files():
+    # The last two receivers of the first set have no paths and are missing from the nested files, the second set has no paths at all
+    no_paths = P2MPaths(np.zeros(0, dtype=np.int32), np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int32), np.zeros((0, 3)))
+    parsed = {metric: [rx_paths, no_paths] for metric, rx_paths in EXAMPLE.items()}
+    stats = stack_channel_statistics(parsed, [5, 2])
+    assert len(stats) == 7
+    expected = channel_statistics(**EXAMPLE)
+    for name in CHANNEL_STATS_DTYPE.names:
+        np.testing.assert_array_equal(stats[name][:3], expected[name], err_msg=name)
+    assert np.isnan(stats['IncoherentPower_dBm'][3:]).all()
+    with pytest.raises(ValueError, match='only 2 receivers'):
+        stack_channel_statistics(parsed, [2, 2])
+
+def test_merge_channel_statistics_rows_follow_power(tmp_path):
+    tx_sets = ['t001_02', 't001_01']
+    rx_sets = ['r010', 'r009', 'r007', 'r011']
+    sequences_stats = [{metric: build_sequence(metric, tx, rx_sets) for metric in ('cir', 'doppler', 'doa', 'dod')} for tx in tx_sets]
+    sequences_power = [build_sequence('power', tx, rx_sets) for tx in tx_sets]
+    stats = merge_channel_statistics(SAMPLE_FOLDER, sequences_stats, sequences_power)
+    n_rows = sum(len(read_p2m_table(os.path.join(SAMPLE_FOLDER, f'AachenSuperC_60GHz.power.t001_01.{rx}.p2m'))) for rx in rx_sets)
+    assert [len(tx_stats) for tx_stats in stats] == [n_rows, n_rows]
+
+    # Dropping the last receiver from the nested files keeps the row count of the flat files
+    folder = str(tmp_path)
+    for file in os.listdir(SAMPLE_FOLDER):
+        if file.endswith('.p2m') and ('.power.' in file or any(f'.{metric}.' in file for metric in sequences_stats[0])):
+            shutil.copy(os.path.join(SAMPLE_FOLDER, file), folder)
+    for metric in sequences_stats[0]:
+        file_path = os.path.join(folder, f'AachenSuperC_60GHz.{metric}.t001_01.r011.p2m')
+        with open(file_path, 'rb') as f:
+            lines = f.read().splitlines(keepends=True)
+        # 5 header lines, the number of receiver points, then '<point> <number of paths>' before the paths of every receiver
+        last = max(position for position, line in enumerate(lines) if position > 5 and len(line.split()) == 2)
+        with open(file_path, 'wb') as f:
+            f.write(b''.join(lines[:5] + [b' %d\n' % (int(lines[5]) - 1)] + lines[6:last]))
+    stats = merge_channel_statistics(folder, sequences_stats[1:], sequences_power[1:])
+    assert len(stats[0]) == n_rows
+    assert np.isnan(stats[0]['IncoherentPower_dBm'][-1])
@@ -0,0 +1,105 @@
+import json
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from manifest import MANIFEST_FILE, is_up_to_date, load_manifest, new_manifest, record_output, save_manifest
+
+INPUTS = ['a.doa.t001_01.r001.p2m', 'b.power.t001_01.r001.p2m']
+OUTPUT = os.path.join('merged_data', 'Out.mat')
+OPTIONS = {'layout': 'dense', 'float32': False}
+
+# This function writes a file below root (creating its folder) and returns its path
+def write_file(root, name, content):
+    file_path = os.path.join(root, name)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, 'wb') as f:
+        f.write(content)
+    return file_path
+
+# This function moves the modification time of a file forward by one second
+def touch(file_path):
+    stat = os.stat(file_path)
+    os.utime(file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+
+# This function writes the inputs and the output into root and returns a manifest recording the output as built from them
+@pytest.fixture(params=[False, True], ids=['stat', 'hash'])
+def built(tmp_path, request):
+    for name in INPUTS:
+        write_file(tmp_path, name, name.encode() * 10)
+    write_file(tmp_path, OUTPUT, b'output')
+    manifest = new_manifest()
+    record_output(manifest, str(tmp_path), OUTPUT, INPUTS, request.param, OPTIONS)
+    return str(tmp_path), manifest, request.param
+
+def test_up_to_date_after_record(built):
+    root, manifest, use_hash = built
+    assert is_up_to_date(manifest, root, OUTPUT, INPUTS, use_hash, OPTIONS)
+    assert is_up_to_date(manifest, root, OUTPUT, list(reversed(INPUTS)), use_hash, OPTIONS)
+
+def test_input_size_change(built):
+    root, manifest, use_hash = built
+    with open(os.path.join(root, INPUTS[0]), 'ab') as f:
+        f.write(b'1')
+    assert not is_up_to_date(manifest, root, OUTPUT, INPUTS, use_hash, OPTIONS)
+
+def test_input_touched(built):
+    root, manifest, use_hash = built
+    touch(os.path.join(root, INPUTS[1]))
+    # Without hashing a new modification time is a change; with hashing an unchanged content still matches
+    assert is_up_to_date(manifest, root, OUTPUT, INPUTS, use_hash, OPTIONS) == use_hash
+
+def test_input_content_change_with_same_size(built):
+    root, manifest, use_hash = built
+    file_path = os.path.join(root, INPUTS[0])
+    with open(file_path, 'rb') as f:
+        content = f.read()
+    write_file(root, INPUTS[0], content[::-1])
+    touch(file_path)
+    assert not is_up_to_date(manifest, root, OUTPUT, INPUTS, use_hash, OPTIONS)
+
+def test_deleted_input(built):
+    root, manifest, use_hash = built
+    os.remove(os.path.join(root, INPUTS[1]))
+    assert not is_up_to_date(manifest, root, OUTPUT, INPUTS, use_hash, OPTIONS)
+
+def test_deleted_output(built):
+    root, manifest, use_hash = built
+    os.remove(os.path.join(root, OUTPUT))
+    assert not is_up_to_date(manifest, root, OUTPUT, INPUTS, use_hash, OPTIONS)
+
+def test_changed_output(built):
+    root, manifest, use_hash = built
+    write_file(root, OUTPUT, b'edited by hand')
+    assert not is_up_to_date(manifest, root, OUTPUT, INPUTS, use_hash, OPTIONS)
+
+def test_changed_inputs(built):
+    root, manifest, use_hash = built
+    write_file(root, 'c.pl.t001_01.r001.p2m', b'new input')
+    assert not is_up_to_date(manifest, root, OUTPUT, INPUTS + ['c.pl.t001_01.r001.p2m'], use_hash, OPTIONS)
+    assert not is_up_to_date(manifest, root, OUTPUT, INPUTS[:1], use_hash, OPTIONS)
+
+@pytest.mark.parametrize('options', [None, {}, {'layout': 'sparse', 'float32': False}, {'layout': 'dense', 'float32': True}, {'layout': 'dense'}])
+def test_changed_options(built, options):
+    root, manifest, use_hash = built
+    assert not is_up_to_date(manifest, root, OUTPUT, INPUTS, use_hash, options)
+
+def test_unknown_output(built):
+    root, manifest, use_hash = built
+    assert not is_up_to_date(manifest, root, os.path.join('merged_data', 'Other.mat'), INPUTS, use_hash, OPTIONS)
+
+def test_save_and_load(built):
+    root, manifest, use_hash = built
+    merged_data = os.path.join(root, 'merged_data')
+    save_manifest(merged_data, manifest)
+    loaded = load_manifest(merged_data)
+    assert loaded == manifest
+    assert is_up_to_date(loaded, root, OUTPUT, INPUTS, use_hash, OPTIONS)
+    assert not os.path.exists(os.path.join(merged_data, MANIFEST_FILE + '.tmp'))
+
+@pytest.mark.parametrize('content', [b'{not json', json.dumps({'version': -1, 'outputs': {}}).encode()])
+def test_load_unreadable_or_old_manifest(tmp_path, content):
+    write_file(str(tmp_path), MANIFEST_FILE, content)
+    assert load_manifest(str(tmp_path)) == new_manifest()
+    assert load_manifest(os.path.join(str(tmp_path), 'missing')) == new_manifest()
@@ -0,0 +1,129 @@
+import glob
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from p2m_parser import FLAT_METRICS, NESTED_METRICS, p2m_metric, read_p2m_paths, read_p2m_table
+
+SAMPLE_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Sample Wireless InSite output files')
+SAMPLE_FILES = sorted(glob.glob(os.path.join(SAMPLE_FOLDER, '*.p2m')))
+SAMPLE_FLAT_FILES = [file_path for file_path in SAMPLE_FILES if p2m_metric(file_path) in FLAT_METRICS]
+SAMPLE_NESTED_FILES = [file_path for file_path in SAMPLE_FILES if p2m_metric(file_path) in NESTED_METRICS]
+
+# Nested file with receivers without paths (first, in the middle and last), CRLF line endings and trailing spaces
+NESTED_WITH_EMPTY_RECEIVERS = (
+    '# <Transmitter Set: Tx: 1 TX1 - Point 1> \r\n'
+    '# <number of receiver points>\r\n'
+    ' 5\r\n'
+    '1 0\r\n'
+    '2 2\r\n'
+    '1 -123.615 85.9016 -75.2171 \r\n'
+    '2 1.5e-07 -0 -87.6245\r\n'
+    '3 0\r\n'
+    '4 1\r\n'
+    '1 99.8942 87.0014 -92.1133\r\n'
+    '5 0\r\n'
+)
+
+# This function returns the lines of a .p2m file after its header comment lines, split into tokens, leaving out empty lines (the reference parse)
+def reference_lines(file_path):
+    with open(file_path, 'r') as f:
+        lines = [line.split() for line in f if not line.startswith('#')]
+    return [line for line in lines if line]
+
+# This function parses a flat file line by line with float()
+def reference_table(file_path):
+    return np.array([[float(token) for token in line] for line in reference_lines(file_path)], dtype=np.float64)
+
+# This function parses a nested file line by line: the number of receiver points, then per receiver point <point> <number of paths> and one line per path
+def reference_paths(file_path):
+    lines = iter(reference_lines(file_path))
+    receivers, offsets, paths, values = [], [0], [], []
+    for _ in range(int(next(lines)[0])):
+        receiver, n_paths = map(int, next(lines))
+        receivers.append(receiver)
+        for _ in range(n_paths):
+            line = next(lines)
+            paths.append(int(line[0]))
+            values.append([float(token) for token in line[1:]])
+        offsets.append(len(paths))
+    return receivers, offsets, paths, values
+
+# This function writes a file into a temporary folder and returns its path
+def write_file(tmp_path, name, content):
+    file_path = os.path.join(tmp_path, name)
+    with open(file_path, 'wb') as f:
+        f.write(content.encode('ascii') if isinstance(content, str) else content)
+    return file_path
+
+# This function checks a parsed nested file against the line-by-line reference parse
+def assert_paths_equal(parsed, file_path):
+    receivers, offsets, paths, values = reference_paths(file_path)
+    np.testing.assert_array_equal(parsed.receiver, receivers)
+    np.testing.assert_array_equal(parsed.offsets, offsets)
+    np.testing.assert_array_equal(parsed.path, paths)
+    np.testing.assert_array_equal(parsed.values, np.array(values, dtype=np.float64).reshape(len(paths), -1))
+    assert parsed.receiver.dtype == np.int32 and parsed.path.dtype == np.int32 and parsed.values.dtype == np.float64
+
+@pytest.mark.parametrize('file_path', SAMPLE_FLAT_FILES, ids=os.path.basename)
+def test_read_p2m_table_matches_reference(file_path):
+    table = read_p2m_table(file_path)
+    assert table.dtype == np.float64
+    np.testing.assert_array_equal(table, reference_table(file_path))
+
+@pytest.mark.parametrize('file_path', SAMPLE_NESTED_FILES, ids=os.path.basename)
+def test_read_p2m_paths_matches_reference(file_path):
+    assert_paths_equal(read_p2m_paths(file_path), file_path)
+
+def test_read_p2m_paths_empty_receivers(tmp_path):
+    file_path = write_file(tmp_path, 'Test.doa.t001_01.r001.p2m', NESTED_WITH_EMPTY_RECEIVERS)
+    parsed = read_p2m_paths(file_path)
+    assert_paths_equal(parsed, file_path)
+    np.testing.assert_array_equal(np.diff(parsed.offsets), [0, 2, 0, 1, 0])
+    assert np.signbit(parsed.values[1, 1])
+
+def test_read_p2m_paths_without_paths(tmp_path):
+    file_path = write_file(tmp_path, 'Test.doa.t001_01.r001.p2m', '# header\n 2\n1 0\n2 0\n')
+    parsed = read_p2m_paths(file_path)
+    np.testing.assert_array_equal(parsed.receiver, [1, 2])
+    np.testing.assert_array_equal(parsed.offsets, [0, 0, 0])
+    assert parsed.path.size == 0
+
+def test_read_p2m_table_crlf_and_blank_lines(tmp_path):
+    file_path = write_file(tmp_path, 'Test.power.t001_01.r001.p2m', '# header\r\n1 0.5 -2 1e3 -72.8479\r\n\r\n2 -0.784026 3.47071 1.6 21.1277 \r\n')
+    np.testing.assert_array_equal(read_p2m_table(file_path), reference_table(file_path))
+
+def test_read_p2m_table_empty_file(tmp_path):
+    assert read_p2m_table(write_file(tmp_path, 'Test.power.t001_01.r001.p2m', '# header only\n')).shape == (0, 0)
+
+@pytest.mark.parametrize('cut', [0.3, 0.5, 0.9])
+def test_read_p2m_paths_truncated_file(tmp_path, cut):
+    with open(SAMPLE_NESTED_FILES[0], 'rb') as f:
+        data = f.read()
+    # Cut the file at a line end, so that only receivers or paths are missing, and in the middle of a line
+    line_end = data.rfind(b'\n', 0, int(len(data) * cut)) + 1
+    for truncated in (data[:line_end], data[:line_end + 3]):
+        file_path = write_file(tmp_path, os.path.basename(SAMPLE_NESTED_FILES[0]), truncated)
+        with pytest.raises(ValueError):
+            read_p2m_paths(file_path)
+
+def test_read_p2m_table_truncated_file(tmp_path):
+    with open(SAMPLE_FLAT_FILES[0], 'rb') as f:
+        data = f.read()
+    file_path = write_file(tmp_path, os.path.basename(SAMPLE_FLAT_FILES[0]), data[:data.rfind(b' ', 0, len(data) // 2)])
+    with pytest.raises(ValueError, match='columns'):
+        read_p2m_table(file_path)
+
+@pytest.mark.parametrize('content, message', [
+    ('# header\n', 'missing number of receiver points'),
+    ('# header\n 3\n1 1\n1 2 3 4\n2 0\n', 'announces 3 receiver points'),
+    ('# header\n 2\n1 2\n1 2 3 4\n2 0\n', 'announce 2 paths but 1'),
+    ('# header\n 2\n1 0\n1 2 3 4\n2 1\n', 'different number of paths'),
+    ('# header\n 1\n1 2\n1 2 3 4\n2 2 3\n', 'path rows do not all have'),
+    ('# header\n 1\n1 1\n1 2 x 4\n', 'Test.doa'),
+])
+def test_read_p2m_paths_malformed_file(tmp_path, content, message):
+    with pytest.raises(ValueError, match=message):
+        read_p2m_paths(write_file(tmp_path, 'Test.doa.t001_01.r001.p2m', content))
@@ -0,0 +1,64 @@
+import glob
+import os
+import sys
+import numpy as np
+import pytest
+from scipy.io import loadmat
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from p2m_parser import INTERACTION_TYPES, iter_paths_chunks
+from mat_writer import write_mat_columns
+from emulate_code_insite import paths_file_columns, write_paths_file
+
+SAMPLE_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Sample Wireless InSite output files')
+SAMPLE_PATHS_FILES = sorted(glob.glob(os.path.join(SAMPLE_FOLDER, '*.paths.*.p2m')))
+
+# Chunk sizes (bytes) that cut the sample files inside headers, receiver blocks, path blocks and point lines
+CHUNK_SIZES = [16, 37, 100, 333, 4096]
+
+# This function reads a .paths file in chunks of chunk_bytes and joins the receiver, path and point records of all chunks
+def read_chunked(file_path, chunk_bytes):
+    chunks = list(iter_paths_chunks(file_path, chunk_bytes))
+    return [np.concatenate([chunk[part] for chunk in chunks]) for part in range(3)]
+
+# This function checks that two structured arrays hold the same records field by field (NaN equals NaN)
+def assert_records_equal(actual, expected):
+    assert actual.dtype == expected.dtype
+    for name in expected.dtype.names:
+        np.testing.assert_array_equal(actual[name], expected[name], err_msg=name)
+
+@pytest.mark.parametrize('file_path', SAMPLE_PATHS_FILES, ids=os.path.basename)
+def test_iter_paths_chunks_does_not_depend_on_chunk_size(file_path):
+    expected = read_chunked(file_path, 1 << 22)
+    assert len(expected[0]) > 0
+    for chunk_bytes in CHUNK_SIZES:
+        for actual, expected_part in zip(read_chunked(file_path, chunk_bytes), expected):
+            assert_records_equal(actual, expected_part)
+
+def test_write_mat_columns_round_trip(tmp_path):
+    rng = np.random.default_rng(0)
+    dtypes = ['<f8', '<f4', 'i1', 'u1', '<i4', '<u4', '<i8']
+    # Odd chunk lengths so that every column needs padding to 8 bytes
+    chunks = [{f'Column_{np.dtype(dtype).name}': (rng.normal(0, 100, size) if np.dtype(dtype).kind == 'f' else rng.integers(0, 100, size)).astype(dtype) for dtype in dtypes}
+              for size in (3, 0, 7, 1)]
+    mat_file_path = os.path.join(tmp_path, 'columns.mat')
+    write_mat_columns(mat_file_path, chunks, {'Names': np.array(['a', 'bc'], dtype=object)})
+
+    mat = loadmat(mat_file_path)
+    assert [str(name[0]) for name in mat['Names'][0]] == ['a', 'bc']
+    for name in chunks[0]:
+        expected = np.concatenate([chunk[name] for chunk in chunks])
+        assert mat[name].dtype == expected.dtype
+        assert mat[name].shape == (len(expected), 1)
+        np.testing.assert_array_equal(mat[name][:, 0], expected)
+
+def test_write_paths_file_round_trip(tmp_path):
+    file_paths = [file_path for file_path in SAMPLE_PATHS_FILES if '.t001_02.' in os.path.basename(file_path)]
+    mat_file_path = os.path.join(tmp_path, 'Tx1Rx_Paths_insitefin.mat')
+    write_paths_file(mat_file_path, file_paths, chunk_bytes=333)
+
+    mat = loadmat(mat_file_path)
+    assert [str(name[0]) for name in mat['InteractionTypes'][0]] == list(INTERACTION_TYPES)
+    chunks = list(paths_file_columns(file_paths))
+    for name in chunks[0]:
+        np.testing.assert_array_equal(mat[name][:, 0], np.concatenate([chunk[name] for chunk in chunks]), err_msg=name)
@@ -0,0 +1,112 @@
+import os
+import sys
+import warnings
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from column_cache import write_table
+from emulate_code_insite import build_ray_tracer_outputs, build_ray_tracer_records, build_rx_scatter_index, cached_transmitters, segment_mean, table_transmitters, tx_columns
+
+GRID = 6
+
+# Receiver position table (Mat_row, Mat_col, first DataTX row, last DataTX row, Power_/Loss_ row) with receivers without rays
+# (rows_end = rows_from - 1) first, in the middle and last, the last one pointing past the end of DataTX
+VALUES = np.array([
+    [1, 1, 0, -1, 1],
+    [1, 2, 0, 2, 2],
+    [2, 4, 3, 3, 3],
+    [3, 3, 4, 3, 4],
+    [5, 1, 4, 7, 5],
+    [4, 5, 8, 8, 6],
+    [5, 5, 9, 8, 7],
+])
+
+# This function returns n_tx DataTX tables (path, Rx azimuth, Rx elevation, power, Tx azimuth, Tx elevation) and the Power_ and Loss_ tables with distinct values
+def fixture_tables(n_tx):
+    rng = np.random.default_rng(5)
+    data_tx = [np.column_stack((np.arange(9) % 4 + 1, rng.uniform(-180, 180, (9, 5)))) for _ in range(n_tx)]
+    Power_ = np.column_stack((np.arange(1, 8), rng.uniform(-150, -20, (7, 4 + 2 * n_tx))))
+    Loss_ = np.column_stack((np.arange(1, 8), rng.uniform(50, 200, (7, 4 + 3 * n_tx))))
+    return data_tx, Power_, Loss_
+
+# This function builds the angle matrices and the receiver records of one transmitter with the per-receiver loop of the original ray_tracer_format
+def reference_outputs(values, data, Power_, Loss_, power_column, loss_column, depth):
+    angles = np.zeros((4, GRID, GRID, depth))
+    records = np.zeros((GRID, GRID), dtype={'names': ('Power_dBm', 'TotalPower_mW', 'TotalPower_dBm', 'Ray_count', 'Loss_dB'), 'formats': ('f8', 'f8', 'f8', 'i4', 'f8')})
+    total_power = np.zeros((GRID, GRID))
+    for mat_row, mat_col, rows_from, rows_end, position_loss in values:
+        rays = data[rows_from:rows_end + 1]
+        for angle, column in enumerate([1, 2, 4, 5]):
+            angles[angle, mat_row, mat_col, :len(rays)] = rays[:, column]
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            records[mat_row - 1, mat_col - 1]['Power_dBm'] = np.mean(rays[:, 3])
+        records[mat_row - 1, mat_col - 1]['TotalPower_mW'] = 10**((abs(Power_[position_loss - 1, power_column]) - 30) / 10)
+        records[mat_row - 1, mat_col - 1]['TotalPower_dBm'] = Power_[position_loss - 1, power_column]
+        records[mat_row - 1, mat_col - 1]['Ray_count'] = rows_end - rows_from + 1
+        records[mat_row - 1, mat_col - 1]['Loss_dB'] = Loss_[position_loss - 1, loss_column]
+        total_power[mat_row - 1, mat_col - 1] = Power_[position_loss - 1, power_column]
+    return angles, records, total_power
+
+def test_segment_mean_matches_loop():
+    index = build_rx_scatter_index(VALUES)
+    columns = np.random.default_rng(1).normal(size=(3, 9))
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        expected = [[np.mean(row[rows_from:rows_end + 1]) for _, _, rows_from, rows_end, _ in VALUES] for row in columns]
+    np.testing.assert_allclose(segment_mean(columns, index), expected, rtol=1e-12)
+    assert np.isnan(segment_mean(columns, index)[:, index.ray_count == 0]).all()
+
+@pytest.mark.parametrize('n_tx', [1, 2, 3])
+def test_build_ray_tracer_outputs_match_loop(n_tx):
+    data_tx, Power_, Loss_ = fixture_tables(n_tx)
+    power_columns, loss_columns = tx_columns(n_tx)
+    index, rays, records, total_power = build_ray_tracer_records(VALUES, table_transmitters(data_tx, Power_, Loss_))
+    # The matrices of each transmitter are filled into those of the previous one, like write_ray_tracer_files does
+    out = None
+    for tx in range(n_tx):
+        out = build_ray_tracer_outputs(index, rays[tx], records[tx], total_power[tx], GRID, out=out)
+        angles, Receiver_Ray_insite, Rx_TotalPower_dBm_Matrix_insite = out
+        assert angles.shape == (4, GRID, GRID, 4)
+        expected_angles, expected_records, expected_total_power = reference_outputs(VALUES, data_tx[tx], Power_, Loss_, power_columns[tx], loss_columns[tx], 4)
+        np.testing.assert_array_equal(angles, expected_angles)
+        np.testing.assert_array_equal(Rx_TotalPower_dBm_Matrix_insite, expected_total_power)
+        for name in expected_records.dtype.names:
+            np.testing.assert_allclose(Receiver_Ray_insite[name], expected_records[name], rtol=1e-12, err_msg=name)
+
+def test_build_ray_tracer_records_receivers_without_rays():
+    data_tx, Power_, Loss_ = fixture_tables(2)
+    index, rays, records, total_power = build_ray_tracer_records(VALUES, table_transmitters(data_tx, Power_, Loss_))
+    np.testing.assert_array_equal(records['Ray_count'], [[0, 3, 1, 0, 4, 1, 0]] * 2)
+    assert np.isnan(records['Power_dBm'][:, [0, 3, 6]]).all()
+    assert not np.isnan(records['Power_dBm'][:, [1, 2, 4, 5]]).any()
+    assert rays.shape == (2, 4, 9)
+
+@pytest.mark.parametrize('n_tx, power_columns, loss_columns', [(1, [5], [6]), (2, [5, 7], [7, 8]), (3, [5, 7, 9], [8, 9, 10])])
+def test_tx_columns(n_tx, power_columns, loss_columns):
+    # Power_ holds a power and a phase column per transmitter, Loss_ the FSPL, then the PL, then the XPL column of every transmitter
+    np.testing.assert_array_equal(tx_columns(n_tx)[0], power_columns)
+    np.testing.assert_array_equal(tx_columns(n_tx)[1], loss_columns)
+
+# Regression test: every transmitter used to take its totals from Power_ column 7 (the TX2 power) and its total power matrix from column 6 (the TX1 phase)
+@pytest.mark.parametrize('cached', [False, True], ids=['tables', 'cache'])
+def test_records_use_the_columns_of_each_transmitter(tmp_path, cached):
+    data_tx, _, _ = fixture_tables(2)
+    # Every value tells its column (hundreds) and its row
+    Power_ = np.arange(9) * 100 + np.arange(1, 8)[:, None] * 1.0
+    Loss_ = np.arange(11) * 100 + np.arange(1, 8)[:, None] * 1.0
+    if cached:
+        for name, table in [('DataTX1_', data_tx[0]), ('DataTX2_', data_tx[1]), ('Power_', Power_), ('Loss_', Loss_)]:
+            write_table(str(tmp_path), name, table)
+        transmitters = cached_transmitters(str(tmp_path), 2)
+    else:
+        transmitters = table_transmitters(data_tx, Power_, Loss_)
+    index, rays, records, total_power = build_ray_tracer_records(VALUES, transmitters)
+    position_loss = VALUES[:, 4]
+    np.testing.assert_array_equal(records['TotalPower_dBm'], [500 + position_loss, 700 + position_loss])
+    np.testing.assert_array_equal(total_power, records['TotalPower_dBm'])
+    np.testing.assert_allclose(records['TotalPower_mW'], 10**((records['TotalPower_dBm'] - 30) / 10))
+    np.testing.assert_array_equal(records['Loss_dB'], [700 + position_loss, 800 + position_loss])
+    _, _, Rx_TotalPower_dBm_Matrix_insite = build_ray_tracer_outputs(index, rays[0], records[0], total_power[0], GRID)
+    np.testing.assert_array_equal(Rx_TotalPower_dBm_Matrix_insite[VALUES[:, 0] - 1, VALUES[:, 1] - 1], 500 + position_loss)
@@ -0,0 +1,77 @@
+import asyncio
+import os
+import shutil
+import sys
+import time
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from emulate_code_insite import METRICS, RX_POSITIONS_FILE, RX_SET_ORDER, TX_SET_ORDER, main
+from file_index import parse_file_name
+from watch_insite import watch_folder, watched_sets
+
+SAMPLE_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Sample Wireless InSite output files')
+MAT_FILES = ['Tx1Rx_Angles_insitefin.mat', 'Tx2Rx_Angles_insitefin.mat', 'SimulationRecord_insiteTX1fin.mat', 'SimulationRecord_insiteTX2fin.mat']
+OPTIONS = {'layout': 'coo'}
+
+# This function returns the variables of a MATLAB file as written, without the 128 byte header (which holds the creation time)
+def read_variables(file_path):
+    with open(file_path, 'rb') as f:
+        return f.read()[128:]
+
+# This function returns the sample files of the given metrics (all .p2m files by default), grouped by receiver set
+def sample_files(metrics=None):
+    files = {}
+    for file in sorted(os.listdir(SAMPLE_FOLDER)):
+        name = parse_file_name(file)
+        if name is not None and name.ext == 'p2m' and (metrics is None or name.metric in metrics):
+            files.setdefault(name.rx, []).append(file)
+    return files
+
+# This function copies the sample files into the target folder one receiver set at a time, like Wireless InSite writes them, and returns the time the last set was written
+# Before every further set it checks that no MATLAB file was written from the sets so far
+async def write_in_stages(target, files, stage_time):
+    for position, rx in enumerate(RX_SET_ORDER):
+        if position:
+            await asyncio.sleep(stage_time)
+            assert not os.path.exists(os.path.join(target, 'merged_data', MAT_FILES[0])), f'main() ran before {rx} was written'
+        for file in files[rx]:
+            shutil.copy(os.path.join(SAMPLE_FOLDER, file), target)
+    return time.time()
+
+# This function watches the target folder while the sample files are written into it in stages and returns the time the last stage was written
+async def watch_stages(target, files, stage_time=1.0):
+    watch = asyncio.create_task(watch_folder(target, workers=1, poll_interval=0.05, settle_time=0.1, timeout=60, **OPTIONS))
+    written = await write_in_stages(target, files, stage_time)
+    await watch
+    return written
+
+def test_watch_waits_for_all_receiver_sets(tmp_path):
+    # All files of every receiver set are written, also those main() does not need
+    target = os.path.join(str(tmp_path), 'watched')
+    os.makedirs(target)
+    files = sample_files()
+    written = asyncio.run(watch_stages(target, files))
+    for file in MAT_FILES:
+        assert os.path.getmtime(os.path.join(target, 'merged_data', file)) >= written - 1
+
+    # The simulation may still be writing, so the watch mode deletes none of the files
+    assert all(os.path.exists(os.path.join(target, file)) for rx_files in files.values() for file in rx_files)
+
+    # The outputs are those of main() run on the complete folder
+    complete = os.path.join(str(tmp_path), 'complete')
+    os.makedirs(complete)
+    for rx_files in sample_files(METRICS).values():
+        for file in rx_files:
+            shutil.copy(os.path.join(SAMPLE_FOLDER, file), complete)
+    main(complete, **OPTIONS)
+    for file in MAT_FILES:
+        assert read_variables(os.path.join(target, 'merged_data', file)) == read_variables(os.path.join(complete, 'merged_data', file)), file
+
+def test_watched_sets():
+    assert watched_sets() == (TX_SET_ORDER, RX_SET_ORDER)
+    assert watched_sets(['t001_01']) == (['t001_01'], RX_SET_ORDER)
+    assert watched_sets(['t001_01'], ['r007'], 'Other positions.xlsx') == (['t001_01'], ['r007'])
+    assert watched_sets(rx_positions_file=RX_POSITIONS_FILE) == (TX_SET_ORDER, RX_SET_ORDER)
+    with pytest.raises(ValueError, match='--rx-sets'):
+        watched_sets(['t001_01'], rx_positions_file='Other positions.xlsx')
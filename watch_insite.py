@@ -0,0 +1,142 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from column_cache import CACHE_FOLDER
+from emulate_code_insite import METRICS, RX_POSITIONS_FILE, RX_SET_ORDER, STATS_METRICS, TX_SET_ORDER, cache_p2m_paths, main
+from file_index import parse_file_name
+from p2m_parser import NESTED_METRICS
+
+# Seconds between two scans of the output folder, and seconds the size and modification time of a file must stay unchanged before it counts as fully written
+POLL_INTERVAL = 1.0
+SETTLE_TIME = 2.0
+
+# This function returns the metrics whose .p2m files are parsed ahead (the nested files) and all metrics that are waited for (the flat files are small and the .paths files are streamed by main())
+def watched_metrics(paths=False, statistics=False):
+    metrics = set(METRICS) | (set(STATS_METRICS) if statistics else set())
+    return {metric for metric in metrics if metric in NESTED_METRICS}, metrics | ({'paths'} if paths else set())
+
+# This function returns the (size, mtime_ns) of a file, or None if it does not exist (any more)
+def file_signature(file_path):
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+# This function scans the output folder once and returns the name and signature of every .p2m file of the metrics, keyed by (metric, transmitter set, receiver set)
+# With tx_sets or rx_sets, only the files of these sets are returned
+def scan_files(folder_path, metrics, tx_sets=None, rx_sets=None):
+    found = {}
+    with os.scandir(folder_path) as entries:
+        for entry in entries:
+            name = parse_file_name(entry.name)
+            if name is None or name.ext != 'p2m' or name.metric not in metrics or (tx_sets and name.tx not in tx_sets) or (rx_sets and name.rx not in rx_sets):
+                continue
+            signature = file_signature(entry.path)
+            if signature is not None:
+                found[(name.metric, name.tx, name.rx)] = (entry.name, signature)
+    return found
+
+# This function returns the transmitter and receiver sets the watch mode waits for: the given sets, or else TX_SET_ORDER and RX_SET_ORDER, the sets RXMatPositions350.xlsx is laid out for
+# The sets cannot be taken from the files found so far, as the simulation writes one receiver set after the other; with another receiver position table they must be given
+def watched_sets(tx_sets=None, rx_sets=None, rx_positions_file=RX_POSITIONS_FILE):
+    if (not tx_sets or not rx_sets) and os.path.abspath(rx_positions_file) != RX_POSITIONS_FILE:
+        raise ValueError(f'The watch mode cannot tell which sets {rx_positions_file} is laid out for; give the transmitter and receiver sets to wait for (--tx-sets and --rx-sets)')
+    return list(tx_sets or TX_SET_ORDER), list(rx_sets or RX_SET_ORDER)
+
+# This function returns the expected files: every metric for each transmitter and receiver set
+def expected_files(metrics, tx_sets, rx_sets):
+    return {(metric, tx, rx) for metric in metrics for tx in tx_sets for rx in rx_sets}
+
+# This function parses one fully written nested .p2m file in the worker pool (at most as many files as the pool has workers are handed to it at a time) and writes it to the columnar cache,
+# where main() memory-maps it from; returns the signature the file was parsed at and whether it was cached unchanged (otherwise main() does not use the cached arrays)
+async def parse_ahead(executor, semaphore, folder_path, file, signature):
+    file_path = os.path.join(folder_path, file)
+    async with semaphore:
+        try:
+            source = await asyncio.get_running_loop().run_in_executor(executor, cache_p2m_paths, file_path, os.path.join(folder_path, CACHE_FOLDER))
+        except (OSError, ValueError) as error:
+            print(f'Could not parse {file} yet: {error}')
+            return signature, False
+    return signature, tuple(source) == tuple(signature) and file_signature(file_path) == signature
+
+# This function watches a Wireless InSite output folder while the simulation is running: every expected nested .p2m file (DOA, DOD, ...) is parsed into the columnar cache in a bounded worker pool as soon as it is fully written
+# (its size and modification time did not change for settle_time seconds), and main() runs the final merge and writes the MATLAB files once the expected set is complete
+# The expected set is every metric main() needs (see watched_metrics) for each of tx_sets and rx_sets (see watched_sets); main() is limited to the same sets and deletes no files,
+# as the simulation may still be writing into the folder
+# options are passed on to main(). With keep_watching the folder is watched on, the outputs are rebuilt whenever the set is complete again after a file changed, and a failed
+# run of main() is reported and tried again once a file changes; timeout (seconds) stops waiting for missing files
+async def watch_folder(folder_path, tx_sets=None, rx_sets=None, workers=1, poll_interval=POLL_INTERVAL, settle_time=SETTLE_TIME, keep_watching=False, timeout=None, **options):
+    if not options.get('in_memory', True):
+        raise ValueError('The watch mode parses the .p2m files ahead for the in-memory mode and cannot be combined with the Excel pipeline')
+    parsed_metrics, metrics = watched_metrics(options.get('paths', False), options.get('statistics', False))
+    tx_sets, rx_sets = watched_sets(tx_sets, rx_sets, options.get('rx_positions_file', RX_POSITIONS_FILE))
+    expected = expected_files(metrics, tx_sets, rx_sets)
+    print(f'Watching {folder_path} for {len(expected)} files ({", ".join(sorted(metrics))} of {", ".join(tx_sets)} and {", ".join(rx_sets)})')
+
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(workers)
+    changed = {}  # key -> (signature, time the signature was first seen)
+    ready = {}  # key -> signature of the fully written (and parsed) file
+    failed = {}  # key -> signature of a file that could not be parsed, tried again once it changes
+    converted = None  # signatures of the files the outputs were last built from
+    tasks = {}
+    start = time.monotonic()
+    result = None
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        try:
+            while True:
+                now = time.monotonic()
+                found = scan_files(folder_path, metrics, tx_sets, rx_sets)
+                # Files that were removed again are no longer ready
+                for key in [key for key in changed if key not in found]:
+                    changed.pop(key)
+                    ready.pop(key, None)
+                for key, (file, signature) in found.items():
+                    if changed.get(key, (None,))[0] != signature:
+                        changed[key] = (signature, now)
+                        ready.pop(key, None)
+                    elif key not in ready and key not in tasks and failed.get(key) != signature and now - changed[key][1] >= settle_time:
+                        if key[0] in parsed_metrics:
+                            tasks[key] = asyncio.create_task(parse_ahead(executor, semaphore, folder_path, file, signature))
+                        else:
+                            ready[key] = signature
+
+                # Collect the files parsed since the last scan; a file that changed while it was parsed or failed to parse is tried again once it changes and settles anew
+                for key in [key for key, task in tasks.items() if task.done()]:
+                    signature, kept = tasks.pop(key).result()
+                    if changed.get(key, (None,))[0] != signature:
+                        continue
+                    if kept:
+                        ready[key] = signature
+                        print(f'Parsed {found[key][0]} ({len(ready)}/{len(expected)})')
+                    else:
+                        failed[key] = signature
+
+                if set(ready) == expected and not tasks:
+                    signatures = dict(ready)
+                    if signatures != converted:
+                        settled = time.monotonic()
+                        print('All expected files are written, merging and writing the MATLAB files')
+                        converted = signatures
+                        try:
+                            result = await loop.run_in_executor(None, partial(main, folder_path, workers=workers, tx_sets=tx_sets, rx_sets=rx_sets, delete_files=False, **options))
+                        except Exception as error:
+                            if not keep_watching:
+                                raise
+                            print(f'Writing the MATLAB files failed, waiting for the files to change: {error}')
+                        else:
+                            print(f'MATLAB files written {time.monotonic() - settled:.1f} s after the last file was parsed')
+                            if not keep_watching:
+                                return result
+                        finally:
+                            start = time.monotonic()
+                elif timeout is not None and time.monotonic() - start > timeout:
+                    missing = sorted(f'.{metric}.{tx}.{rx}' for metric, tx, rx in expected - set(ready))
+                    raise TimeoutError(f'{len(missing)} expected files were not written within {timeout} s:\n' + '\n'.join(missing))
+                await asyncio.sleep(poll_interval)
+        finally:
+            for task in tasks.values():
+                task.cancel()